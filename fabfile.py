@@ -27,6 +27,7 @@ def deploy(target='dev', sha1=None):
         run('%s/bin/python manage.py compilemessages' % python_env)
         run('%s/bin/python manage.py migrate' % python_env)
         run('%s/bin/python manage.py collectstatic --noinput' % python_env)
+        run('%s/bin/python manage.py precompile_templates' % python_env)
         # worker reload
         run('echo r > /var/run/pyconkr-2017-%s.fifo' % target)
 
@@ -1,18 +1,21 @@
 from django import forms
-from django.contrib import admin
+from django.conf.urls import url
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.contrib.flatpages.models import FlatPage
 from django.db import models
+from django.template.response import TemplateResponse
 from django_summernote.admin import SummernoteModelAdmin
 from django_summernote.widgets import SummernoteWidget
 from modeltranslation.admin import TranslationAdmin
 from sorl.thumbnail.admin import AdminImageMixin
-from .models import (Room, Program, ProgramTime, ProgramDate, ProgramCategory,
+from .models import (Room, Program, ProgramTime, ProgramDate, ProgramCategory, Slot,
                      Speaker, Sponsor, SponsorLevel, Preference,
                      Profile, Announcement, EmailToken, Proposal, Banner,
                      TutorialProposal, TutorialCheckin, SprintProposal)
 from .actions import convert_proposal_to_program
+from .schedule import find_schedule_conflicts
 
 
 class SummernoteWidgetWithCustomToolbar(SummernoteWidget):
@@ -72,12 +75,41 @@ class SpeakerAdmin(SummernoteModelAdmin, TranslationAdmin):
 admin.site.register(Speaker, SpeakerAdmin)
 
 
+class SlotInline(admin.TabularInline):
+    model = Slot
+    extra = 1
+
+
 class ProgramAdmin(SummernoteModelAdmin, TranslationAdmin):
     list_display = ('id', 'name', 'date', 'room', 'get_speakers', 'category', 'is_recordable',)
     list_editable = ('name', 'category', 'is_recordable',)
     ordering = ('id',)
-    filter_horizontal = ('times', )
+    inlines = (SlotInline, )
     search_fields = ('name', 'speakers__name', 'desc',)
+
+    def get_queryset(self, request):
+        queryset = super(ProgramAdmin, self).get_queryset(request)
+        return queryset.with_schedule_relations()
+
+    def get_urls(self):
+        return [
+            url(r'^conflicts/$', self.admin_site.admin_view(self.conflicts_view),
+                name='pyconkr_program_conflicts'),
+        ] + super(ProgramAdmin, self).get_urls()
+
+    def conflicts_view(self, request):
+        return TemplateResponse(request, 'admin/pyconkr/program/conflicts.html', dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Schedule conflicts',
+            conflicts=find_schedule_conflicts(),
+        ))
+
+    def save_related(self, request, form, formsets, change):
+        super(ProgramAdmin, self).save_related(request, form, formsets, change)
+        for kind, name, slot, other in find_schedule_conflicts(form.instance):
+            messages.warning(request, '%s %s is double-booked: %s and %s overlap' % (
+                kind, name, slot.program, other.program))
 admin.site.register(Program, ProgramAdmin)
 
 
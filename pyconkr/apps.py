@@ -0,0 +1,13 @@
+from __future__ import unicode_literals
+
+from django.apps import AppConfig
+from django.core import checks
+
+
+class PyconkrConfig(AppConfig):
+    name = 'pyconkr'
+
+    def ready(self):
+        from . import signals  # noqa
+        from .caches import check_shared_cache
+        checks.register(check_shared_cache, 'caches')
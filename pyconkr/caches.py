@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.core import checks
+from django.core.cache import cache
+from django.utils import timezone, translation
+
+from .models import Banner, Speaker, SponsorLevel
+
+CACHE_TIMEOUT = 60 * 60 * 24
+# backends that each worker process keeps to itself
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the default cache is not shared between the workers.
+
+    The versions below, the registration waiting room and the Iamport token
+    lock only work across processes through the cache.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Warning(
+        '%s is not shared between worker processes.' % backend,
+        hint='Set CACHES to a shared backend such as memcached, or the waiting room '
+             'admits REGISTRATION_ADMISSION_RATE buyers per process and cache '
+             'versions are only bumped in the process that saved.',
+        id='pyconkr.W001',
+    )]
+
+
+def get_version(name):
+    key = '%s:version' % name
+    version = cache.get(key)
+    if version is None:
+        # start from the clock so an evicted counter never reuses an old version
+        cache.add(key, int(time.time() * 1000000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    key = '%s:version' % name
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000000), None)
+
+
+def get_flatpage_content(url, language):
+    """Return the content of the flatpage at ``url``, or ``None`` if there is none.
+
+    Missing pages are cached as well, as most pages have no flatpage.
+    """
+    key = 'flatpage:%s:%s:%s' % (language, get_version('flatpage'),
+                                 hashlib.md5(url.encode('utf-8')).hexdigest())
+    cached = cache.get(key)
+    if cached is None:
+        page = FlatPage.objects.filter(url=url).first()
+        cached = (page.content if page else None,)
+        cache.set(key, cached, CACHE_TIMEOUT)
+    return cached[0]
+
+
+def flatpage_changed(sender, **kwargs):
+    bump_version('flatpage')
+
+
+def build_sponsor_tree():
+    levels = SponsorLevel.objects.prefetch_related('sponsor_set')
+    tree = []
+    for level in levels:
+        sponsors = [{
+            'slug': sponsor.slug,
+            'name': sponsor.name,
+            'url': sponsor.get_absolute_url(),
+            'image': sponsor.image.url if sponsor.image else None,
+        } for sponsor in level.sponsor_set.all()]
+        if sponsors:
+            tree.append({'name': level.name, 'slug': level.slug, 'order': level.order,
+                         'sponsors': sponsors})
+    return tree
+
+
+def get_sponsor_tree(language):
+    key = 'sponsors:%s:%s' % (language, get_version('sponsors'))
+    tree = cache.get(key)
+    if tree is None:
+        with translation.override(language):
+            tree = build_sponsor_tree()
+        cache.set(key, tree, CACHE_TIMEOUT)
+    return tree
+
+
+def sponsors_changed(sender, **kwargs):
+    bump_version('sponsors')
+
+
+def get_active_banners():
+    """Return the banners shown now, cached until the next begin or end."""
+    now = timezone.now()
+    key = 'banners:%s' % get_version('banners')
+    cached = cache.get(key)
+    if cached is not None and (cached[1] is None or now < cached[1]):
+        return cached[0]
+
+    # upcoming and active banners, so the next transition is known too
+    banners = list(Banner.objects.filter(end__gte=now).exclude(begin=None))
+    active = [b for b in banners if b.begin <= now]
+    transitions = [b.begin for b in banners if b.begin > now] + \
+                  [b.end + timedelta(microseconds=1) for b in banners]
+    expires_at = min(transitions) if transitions else None
+
+    timeout = CACHE_TIMEOUT
+    if expires_at is not None:
+        timeout = min(max(math.ceil((expires_at - now).total_seconds()), 1), timeout)
+    cache.set(key, (active, expires_at), timeout)
+    return active
+
+
+def banners_changed(sender, **kwargs):
+    bump_version('banners')
+
+
+def get_speaker_id(email):
+    """Return the id of the speaker with ``email``, or ``None``."""
+    key = 'speaker:%s:%s' % (get_version('speakers'),
+                             hashlib.md5(email.encode('utf-8')).hexdigest())
+    speaker_id = cache.get(key)
+    if speaker_id is None:
+        speaker_id = Speaker.objects.filter(email=email).values_list('id', flat=True).first() or 0
+        cache.set(key, speaker_id, CACHE_TIMEOUT)
+    return speaker_id or None
+
+
+def speakers_changed(sender, **kwargs):
+    bump_version('speakers')
+
+
+def announcements_changed(sender, **kwargs):
+    bump_version('announcements')
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import time
+
+from constance import config as constance_config, settings as constance_settings, utils
+
+# without a shared cache a version bump stays in its own process, so the
+# values are reloaded at least this often
+CONFIG_MEMO_TIMEOUT = 60
+
+
+class CachedConfig(object):
+    """Read-through replacement of ``constance.config``.
+
+    All keys are loaded with one query through the constance backend and
+    kept per process until the config version changes or
+    ``CONFIG_MEMO_TIMEOUT`` passes. Writes go to constance, which bumps
+    the version.
+    """
+
+    def __init__(self):
+        super(CachedConfig, self).__setattr__('_backend', None)
+        super(CachedConfig, self).__setattr__('_state', (None, 0, {}))
+
+    def _load(self):
+        if self._backend is None:
+            backend = utils.import_module_attr(constance_settings.BACKEND)()
+            super(CachedConfig, self).__setattr__('_backend', backend)
+        values = dict((key, options[0]) for key, options in constance_settings.CONFIG.items())
+        values.update((key, value) for key, value in self._backend.mget(constance_settings.CONFIG.keys())
+                      if value is not None)
+        return values
+
+    def _values(self):
+        # imported here as pyconkr.caches imports the models, which import this
+        from .caches import get_version
+        version = get_version('config')
+        loaded_version, loaded_at, values = self._state
+        if loaded_version != version or time.time() - loaded_at > CONFIG_MEMO_TIMEOUT:
+            values = self._load()
+            super(CachedConfig, self).__setattr__('_state', (version, time.time(), values))
+        return values
+
+    def __getattr__(self, key):
+        try:
+            return self._values()[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        setattr(constance_config, key, value)
+
+    def __dir__(self):
+        return constance_settings.CONFIG.keys()
+
+
+config = CachedConfig()
+
+
+def config_changed(sender, **kwargs):
+    from .caches import bump_version
+    bump_version('config')
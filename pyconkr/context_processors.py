@@ -1,123 +1,143 @@
 from collections import OrderedDict
+from types import MappingProxyType
 
-from django.utils import timezone
 from django.conf import settings
-from django.contrib.flatpages.models import FlatPage
-from django.db.models import Count
+from django.utils import translation
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import ugettext_lazy as _
 
-from .models import SponsorLevel, Speaker, Banner
+from .caches import get_active_banners, get_flatpage_content, get_speaker_id, get_sponsor_tree
+from .config import config as cached_config
+from .models import Speaker
+
+
+MENU = (
+    ('about', _('About'), 'python', (
+        ('pyconkr', _('About PyCon Korea 2017')),
+        ('coc', _('Code of Conduct')),
+        ('blog', _('PyCon.KR 2017 Blog')),
+        ('announcements', _('Announcements')),
+        ('sponsor', _('Sponsors')),
+        ('patron', _('Patrons')),
+        ('sponsorship', _('Sponsorship')),
+        ('staff', _('Staff')),
+        ('contact', _('Contact')),
+    )),
+    ('program', _('Programs'), 'calendar', (
+        ('schedule', _('Schedule')),
+        ('list', _('Program list')),
+        ('keynote', _('Keynotes')),
+        ('speaker', _('Speakers')),
+        ('tutorials', _('Sprint and Tutorial')),
+        ('young_coder', _('Young Coder')),
+        ('child_care', _('Child Care')),
+        ('lightning_talk', _('Lightning talk')),
+        ('ost', _('Open Spaces')),
+    )),
+    ('venue', _('Venue'), 'map-marker', (
+        ('map', _('Venue Map')),
+        ('transportation', _('Transportation')),
+    )),
+    ('cfp', _('Proposal'), 'edit', (
+        ('cfp', _('Call for proposals')),
+        ('howto', _('How to propose')),
+    )),
+    ('registration', _('Registration'), 'book', (
+        ('information', _('Information')),
+        ('purchase', _('Purchase a ticket')),
+        ('finacial-aid', _('Financial Aid')),
+    )),
+)
+
+# language -> {path: {'menu', 'submenu', 'title'}}, compiled once per process
+_compiled_menus = {}
+
+
+def _build_menu(active=None, active_sub=None):
+    menu = OrderedDict()
+    for key, title, icon, submenu in MENU:
+        path = '/{}/'.format(key)
+        items = OrderedDict()
+        for sk, st in submenu:
+            items[sk] = MappingProxyType({
+                'title': str(st),
+                'path': '{}{}/'.format(path, sk),
+                'active': key == active and sk == active_sub,
+            })
+        menu[key] = MappingProxyType({
+            'title': str(title),
+            'icon': icon,
+            'submenu': MappingProxyType(items),
+            'active': key == active,
+        })
+    return MappingProxyType(menu)
+
+
+def compile_menu():
+    """Return the menu of the active language for every menu path.
+
+    The section path covers every page below it; a submenu path also marks
+    its item active.
+    """
+    menus = {None: MappingProxyType({'menu': _build_menu(), 'submenu': None, 'title': None})}
+    for key, title, icon, submenu in MENU:
+        path = '/{}/'.format(key)
+        menu = _build_menu(key)
+        menus[path] = MappingProxyType({
+            'menu': menu, 'submenu': menu[key]['submenu'], 'title': str(title)})
+        for sk, st in submenu:
+            menu = _build_menu(key, sk)
+            menus['{}{}/'.format(path, sk)] = MappingProxyType({
+                'menu': menu, 'submenu': menu[key]['submenu'], 'title': str(st)})
+    return menus
+
+
+def get_menu(language, path):
+    menus = _compiled_menus.get(language)
+    if menus is None:
+        with translation.override(language):
+            menus = _compiled_menus[language] = compile_menu()
+
+    return menus.get(path) or menus.get(path[:path.find('/', 1) + 1]) or menus[None]
 
 
 def default(request):
-    title = None
     # remove i18n_patterns prefix for flatpage
     url = request.path.replace('/' + request.LANGUAGE_CODE, '')
     if settings.FORCE_SCRIPT_NAME:
         url = url[len(settings.FORCE_SCRIPT_NAME):]
-    base_content = FlatPage.objects.filter(url=url).first()
-
-    submenu = None
-    menu = OrderedDict([
-        ('about', {
-            'title': _('About'),
-            'icon': 'python',
-            'submenu': OrderedDict([
-                ('pyconkr', {'title': _('About PyCon Korea 2017')}),
-                ('coc', {'title': _('Code of Conduct')}),
-                ('blog', {'title': _('PyCon.KR 2017 Blog')}),
-                ('announcements', {'title': _('Announcements')}),
-                ('sponsor', {'title': _('Sponsors')}),
-                ('patron', {'title': _('Patrons')}),
-                ('sponsorship', {'title': _('Sponsorship')}),
-                ('staff', {'title': _('Staff')}),
-                ('contact', {'title': _('Contact')}),
-            ]),
-        }),
-        ('program', {
-            'title': _('Programs'),
-            'icon': 'calendar',
-            'submenu': OrderedDict([
-                ('schedule', {'title': _('Schedule')}),
-                ('list', {'title': _('Program list')}),
-                ('keynote', {'title': _('Keynotes')}),
-                ('speaker', {'title': _('Speakers')}),
-                ('tutorials', {'title': _('Sprint and Tutorial')}),
-                ('young_coder', {'title': _('Young Coder')}),
-                ('child_care', {'title': _('Child Care')}),
-                ('lightning_talk', {'title': _('Lightning talk')}),
-                ('ost', {'title': _('Open Spaces')}),
-            ]),
-        }),
-        ('venue', {
-            'title': _('Venue'),
-            'icon': 'map-marker',
-            'submenu': OrderedDict([
-                ('map', {'title': _('Venue Map')}),
-                ('transportation', {'title': _('Transportation')}),
-            ]),
-        }),
-        ('cfp', {
-            'title': _('Proposal'),
-            'icon': 'edit',
-            'submenu': OrderedDict([
-                ('cfp', {'title': _('Call for proposals')}),
-                ('howto', {'title': _('How to propose')}),
-            ]),
-        }),
-        ('registration', {
-            'title': _('Registration'),
-            'icon': 'book',
-            'submenu': OrderedDict([
-                ('information', {'title': _('Information')}),
-                ('purchase', {'title': _('Purchase a ticket')}),
-                ('finacial-aid', {'title': _('Financial Aid')}),
-            ]),
-        }),
-    ])
-
-    rp = request.path[len(settings.FORCE_SCRIPT_NAME):]
-
-    for k, v in menu.items():
-        path = '/{}/'.format(k)
-
-        if rp.startswith(path):
-            v['active'] = True
-            title = v['title']
-
-            if 'submenu' in v:
-                submenu = v['submenu']
-
-                for sk, sv in v['submenu'].items():
-                    sv['path'] = '{}{}/'.format(path, sk)
-                    subpath = sv['path']
-
-                    if rp == subpath:
-                        sv['active'] = True
-                        title = sv['title']
-
-    now = timezone.now()
-    banners = Banner.objects.filter(begin__lte=now, end__gte=now)
+    base_content = get_flatpage_content(url, request.LANGUAGE_CODE)
+
+    menu = get_menu(request.LANGUAGE_CODE, url)
 
     c = {
-        'menu': menu,
-        'submenu': submenu,
-        'banners': banners,
-        'title': title,
+        'menu': menu['menu'],
+        'submenu': menu['submenu'],
+        'banners': get_active_banners(),
+        'title': menu['title'],
         'domain': settings.DOMAIN,
-        'base_content': base_content.content if base_content else '',
+        'base_content': base_content or '',
     }
     return c
 
 
 def profile(request):
-    speaker = None
-    programs = None
-
-    if request.user.is_authenticated():
-        speaker = Speaker.objects.filter(email=request.user.email).first()
-        if speaker:
-            programs = speaker.program_set.all()
+    def get_speaker():
+        if not request.user.is_authenticated() or not request.user.email:
+            return None
+        speaker_id = get_speaker_id(request.user.email)
+        if speaker_id is None:
+            return None
+        return Speaker.objects.filter(id=speaker_id).first()
+
+    def get_programs():
+        if not speaker:
+            return None
+        return list(speaker.program_set.all())
+
+    # only evaluated when a template reads them
+    speaker = SimpleLazyObject(get_speaker)
+    programs = SimpleLazyObject(get_programs)
 
     return {
         'my_speaker': speaker,
@@ -126,9 +146,12 @@ def profile(request):
 
 
 def sponsors(request):
-    levels = SponsorLevel.objects.annotate(
-        num_sponsors=Count('sponsor')).filter(num_sponsors__gt=0)
+    return {
+        'levels': get_sponsor_tree(request.LANGUAGE_CODE),
+    }
+
 
+def config(request):
     return {
-        'levels': levels,
+        'config': cached_config,
     }
@@ -5,7 +5,9 @@ from django.http import HttpResponse
 from django.template import Context
 from django.template.loader import render_to_string, get_template
 import json
+import os
 from django.shortcuts import render
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
 
 def sendEmailToken(request, token):
 
@@ -35,3 +37,25 @@ def render_io_error(reason):
     response = HttpResponse(reason)
     response.status_code = 406
     return response
+
+
+def precompile_templates():
+    """Load every template of every engine so the cached loader holds them.
+
+    Returns the names of the compiled templates and ``(name, error)`` for
+    those that failed.
+    """
+    compiled = []
+    failed = []
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    name = os.path.relpath(os.path.join(root, filename), directory)
+                    try:
+                        engine.get_template(name)
+                    except (TemplateDoesNotExist, TemplateSyntaxError, UnicodeDecodeError) as e:
+                        failed.append((name, e))
+                    else:
+                        compiled.append(name)
+    return compiled, failed
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pyconkr.schedule import find_schedule_conflicts
+
+
+class Command(BaseCommand):
+    help = 'Report double-booked rooms and speakers'
+
+    def handle(self, *args, **options):
+        conflicts = find_schedule_conflicts()
+        for kind, name, slot, other in conflicts:
+            self.stdout.write('%s %s: %s (%s) overlaps %s (%s)' % (
+                kind, name,
+                slot.program, timezone.localtime(slot.begin_datetime).strftime('%Y-%m-%d %H:%M'),
+                other.program, timezone.localtime(other.begin_datetime).strftime('%Y-%m-%d %H:%M')))
+        self.stdout.write('%d conflict(s) found' % len(conflicts))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from pyconkr.helper import precompile_templates
+
+
+class Command(BaseCommand):
+    help = 'Compile every project and app template, reporting the broken ones'
+
+    def handle(self, *args, **options):
+        compiled, failed = precompile_templates()
+        for name, error in failed:
+            self.stderr.write('%s: %s' % (name, error))
+        self.stdout.write('%d template(s) compiled, %d failed' % (len(compiled), len(failed)))
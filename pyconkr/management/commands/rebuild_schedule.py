@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pyconkr.schedule import rebuild_schedule_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the schedule snapshot of every language'
+
+    def handle(self, *args, **options):
+        rebuild_schedule_snapshots()
+        self.stdout.write('schedule snapshot rebuilt')
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+# metric name -> (help, bucket upper bounds)
+METRICS = OrderedDict([
+    ('pyconkr_view_queries', (
+        'SQL queries per request', (1, 2, 5, 10, 20, 50, 100, 200))),
+    ('pyconkr_view_sql_seconds', (
+        'Time spent in SQL per request', (.005, .01, .025, .05, .1, .25, .5, 1, 2.5))),
+    ('pyconkr_view_render_seconds', (
+        'Time spent rendering templates per request', (.005, .01, .025, .05, .1, .25, .5, 1))),
+    ('pyconkr_view_duration_seconds', (
+        'Wall time per request', (.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))),
+])
+
+IAMPORT_METRICS = OrderedDict([
+    ('pyconkr_iamport_duration_seconds', (
+        'Wall time per Iamport API call, retries included', (.05, .1, .25, .5, 1, 2.5, 5, 10, 30))),
+])
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RenderTimer(threading.local):
+    """Seconds spent rendering templates in the current thread."""
+
+    def __init__(self):
+        self.seconds = 0
+        self.depth = 0
+
+
+class ViewMetrics(object):
+    """Histograms of ``metrics`` per view, or other ``label``, kept in process memory."""
+
+    def __init__(self, metrics=METRICS, label='view'):
+        self.metrics = metrics
+        self.label = label
+        self._lock = threading.Lock()
+        self._histograms = {}  # (metric, view) -> Histogram
+
+    def observe(self, view, **values):
+        with self._lock:
+            for metric, value in values.items():
+                key = (metric, view)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(self.metrics[metric][1])
+                self._histograms[key].observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms = {}
+
+    def render(self):
+        """Return the histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric, (help_text, _) in self.metrics.items():
+                lines.append('# HELP %s %s' % (metric, help_text))
+                lines.append('# TYPE %s histogram' % metric)
+                for (name, view), histogram in sorted(self._histograms.items()):
+                    if name != metric:
+                        continue
+                    label = _escape(view)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append('%s_bucket{%s="%s",le="%s"} %d' % (metric, self.label, label, bound, cumulative))
+                    lines.append('%s_sum{%s="%s"} %s' % (metric, self.label, label, histogram.sum))
+                    lines.append('%s_count{%s="%s"} %d' % (metric, self.label, label, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+render_timer = RenderTimer()
+view_metrics = ViewMetrics()
+iamport_metrics = ViewMetrics(IAMPORT_METRICS, label='endpoint')
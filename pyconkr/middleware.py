@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import time
+
+from django.contrib.messages import get_messages
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .caches import get_version
+from .metrics import render_timer, view_metrics
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_TIMEOUT = 60 * 5
+# how long browsers and proxies may reuse a public page
+PAGE_MAX_AGE = 60
+
+# url name -> versions the page depends on besides the ones of base.html
+PAGE_CACHE_DEPENDENCIES = {
+    'announcements': ('announcements',),
+    'announcement': ('announcements',),
+    'speakers': ('speakers',),
+    'speaker': ('speakers', 'schedule'),
+    'sponsors': ('sponsors',),
+    'sponsor': ('sponsors',),
+    'program': ('schedule',),
+    'room': ('schedule',),
+    'flatpage': (),
+}
+PAGE_CACHE_BASE_DEPENDENCIES = ('banners', 'flatpage', 'sponsors', 'config')
+
+
+class AnonymousPageCacheMiddleware(MiddlewareMixin):
+    """Serve read-mostly public pages to anonymous visitors from the cache.
+
+    Pages are cached per language and path, under the versions of the
+    models they show, so saving one of them purges its pages. Time based
+    content such as slide links settles within ``PAGE_CACHE_TIMEOUT``.
+    The same pages are marked public for every visitor, as me.js fills in
+    their per-user parts.
+    """
+
+    def _url_name(self, request):
+        if request.method != 'GET':
+            return None
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        return url_name if url_name in PAGE_CACHE_DEPENDENCIES else None
+
+    def _cache_key(self, request, url_name):
+        if url_name is None or request.user.is_authenticated():
+            return None
+        # the page would show them to every visitor
+        if len(get_messages(request)):
+            return None
+
+        names = PAGE_CACHE_BASE_DEPENDENCIES + PAGE_CACHE_DEPENDENCIES[url_name]
+        versions = '.'.join(str(get_version(name)) for name in names)
+        path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+        return 'page:%s:%s:%s' % (request.LANGUAGE_CODE, path, versions)
+
+    def _patch_headers(self, response):
+        # the per-user parts come from /me/fragment, so the page only varies
+        # by language, which is negotiated from the header or the cookie
+        patch_cache_control(response, public=True, max_age=PAGE_MAX_AGE)
+        patch_vary_headers(response, ('Accept-Language', 'Cookie'))
+        return response
+
+    def process_request(self, request):
+        request._page_url_name = self._url_name(request)
+        request._page_cache_key = self._cache_key(request, request._page_url_name)
+        if request._page_cache_key is None:
+            return None
+
+        cached = cache.get(request._page_cache_key)
+        if cached is None:
+            return None
+        request._page_cache_key = None
+        content, content_type = cached
+        return self._patch_headers(HttpResponse(content, content_type=content_type))
+
+    def process_response(self, request, response):
+        if (getattr(request, '_page_url_name', None) is None or response.status_code != 200
+                or response.streaming or response.cookies):
+            return response
+
+        self._patch_headers(response)
+        key = getattr(request, '_page_cache_key', None)
+        if key is not None and not request.user.is_authenticated():
+            cache.set(key, (response.content, response['Content-Type']), PAGE_CACHE_TIMEOUT)
+        return response
+
+
+class ViewMetricsMiddleware(MiddlewareMixin):
+    """Record query count, SQL time, render time and wall time per view.
+
+    The SQL of every request is kept until the response, so views over their
+    entry in ``settings.VIEW_QUERY_BUDGETS`` (keyed by view name, with
+    ``None`` as the default) log a warning with their SQL. Django clears the
+    query log when each request starts, which bounds the memory it takes.
+    """
+
+    def process_request(self, request):
+        request._metrics_started = time.time()
+        render_timer.seconds = 0
+        request._metrics_queries = len(connection.queries_log)
+        request._metrics_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+
+    def _view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # responses from the page cache never reach the resolver
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return 'unresolved'
+        return match.view_name
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_metrics_started'):
+            return response
+        view = self._view_name(request)
+        connection.force_debug_cursor = request._metrics_debug_cursor
+        queries = list(connection.queries_log)[request._metrics_queries:]
+        view_metrics.observe(
+            view,
+            pyconkr_view_queries=len(queries),
+            pyconkr_view_sql_seconds=sum(float(q['time']) for q in queries),
+            pyconkr_view_render_seconds=render_timer.seconds,
+            pyconkr_view_duration_seconds=time.time() - request._metrics_started,
+        )
+
+        budgets = getattr(settings, 'VIEW_QUERY_BUDGETS', {})
+        budget = budgets.get(view, budgets.get(None))
+        if budget is not None and len(queries) > budget:
+            logger.warning('%s ran %d queries over its budget of %d on %s:\n%s',
+                           view, len(queries), budget, request.path,
+                           '\n'.join(q['sql'] for q in queries))
+        return response
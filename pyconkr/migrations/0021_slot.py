@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyconkr', '0020_schedulesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Slot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('begin_datetime', models.DateTimeField()),
+                ('end_datetime', models.DateTimeField()),
+                ('day', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pyconkr.ProgramDate')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='pyconkr.Program')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pyconkr.Room')),
+            ],
+            options={
+                'ordering': ['begin_datetime', 'room'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='programtime',
+            options={'ordering': ['begin']},
+        ),
+        migrations.AlterIndexTogether(
+            name='slot',
+            index_together=set([('program', 'begin_datetime'), ('room', 'begin_datetime', 'end_datetime'), ('day', 'begin_datetime')]),
+        ),
+    ]
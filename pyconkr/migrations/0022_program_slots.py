@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def times_to_slots(apps, schema_editor):
+    Program = apps.get_model('pyconkr', 'Program')
+    Slot = apps.get_model('pyconkr', 'Slot')
+
+    slots = []
+    programs = Program.objects.select_related('date').prefetch_related('rooms', 'times__day')
+    for program in programs:
+        # one slot per room and run of back-to-back times; a gap starts a new slot
+        days = {}
+        for time in program.times.all():
+            day = time.day or program.date
+            if day is not None:
+                days.setdefault(day.id, (day, []))[1].append(time)
+
+        spans = []
+        for day, times in days.values():
+            for time in sorted(times, key=lambda t: t.begin):
+                if spans and spans[-1][0] == day and spans[-1][2] == time.begin:
+                    spans[-1] = (day, spans[-1][1], max(spans[-1][2], time.end))
+                else:
+                    spans.append((day, time.begin, time.end))
+
+        for day, begin, end in spans:
+            for room in program.rooms.all():
+                slots.append(Slot(
+                    program=program,
+                    room=room,
+                    day=day,
+                    begin_datetime=timezone.make_aware(datetime.combine(day.day, begin)),
+                    end_datetime=timezone.make_aware(datetime.combine(day.day, end)),
+                ))
+
+    Slot.objects.bulk_create(slots)
+
+
+def slots_to_times(apps, schema_editor):
+    Slot = apps.get_model('pyconkr', 'Slot')
+    ProgramTime = apps.get_model('pyconkr', 'ProgramTime')
+
+    for slot in Slot.objects.select_related('program', 'day'):
+        begin = timezone.localtime(slot.begin_datetime).time()
+        end = timezone.localtime(slot.end_datetime).time()
+        slot.program.rooms.add(slot.room_id)
+        slot.program.times.add(*ProgramTime.objects.filter(
+            day=slot.day, begin__gte=begin, end__lte=end))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyconkr', '0021_slot'),
+    ]
+
+    operations = [
+        migrations.RunPython(times_to_slots, slots_to_times),
+    ]
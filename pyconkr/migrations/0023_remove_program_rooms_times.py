@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:51
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyconkr', '0022_program_slots'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='program',
+            name='rooms',
+        ),
+        migrations.RemoveField(
+            model_name='program',
+            name='times',
+        ),
+    ]
@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 from django.contrib.auth.models import User
 from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models.expressions import RawSQL
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.template.defaultfilters import date as _date
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from sorl.thumbnail import ImageField as SorlImageField
 from jsonfield import JSONField
 from uuid import uuid4
-from constance import config
+from .config import config
 
 class Room(models.Model):
     name = models.CharField(max_length=100)
@@ -37,7 +40,7 @@ class ProgramTime(models.Model):
     end = models.TimeField()
     day = models.ForeignKey(ProgramDate, null=True, blank=True)
 
-    def __meta__(self):
+    class Meta:
         ordering = ['begin']
 
     def __str__(self):
@@ -139,6 +142,21 @@ class Speaker(models.Model):
         return '%s / %s' % (self.name, self.slug)
 
 
+class ProgramQuerySet(models.QuerySet):
+    def with_schedule_relations(self):
+        """Fetch everything the schedule helpers of Program read.
+
+        ``room_total`` lets ``Program.room`` compare against the number of
+        rooms without a query per program.
+        """
+        return self.select_related('date', 'category').prefetch_related(
+            'speakers',
+            models.Prefetch('slots', queryset=Slot.objects.select_related('room', 'day')),
+        ).annotate(
+            room_total=RawSQL('SELECT COUNT(*) FROM %s' % Room._meta.db_table, ()),
+        )
+
+
 class Program(models.Model):
     name = models.CharField(max_length=255, db_index=True)
     brief = models.TextField(null=True, blank=True)
@@ -167,55 +185,62 @@ class Program(models.Model):
                                 ), default='E')
 
     date = models.ForeignKey(ProgramDate, null=True, blank=True)
-    rooms = models.ManyToManyField(Room, blank=True)
-    times = models.ManyToManyField(ProgramTime, blank=True)
     category = models.ForeignKey(ProgramCategory, null=True, blank=True)
 
     is_recordable = models.BooleanField(default=True)
     is_breaktime = models.BooleanField(default=False)
 
+    objects = ProgramQuerySet.as_manager()
+
     def get_absolute_url(self):
         return reverse('program', args=[self.id])
 
-    def room(self):
-        rooms = self.rooms.all()
+    def sorted_slots(self):
+        # sorted here so prefetched slots are used as they are
+        return sorted(self.slots.all(), key=lambda s: (s.begin_datetime, s.room_id))
 
-        if rooms.count() == Room.objects.all().count():
+    def room(self):
+        rooms = []
+        for slot in self.sorted_slots():
+            if slot.room not in rooms:
+                rooms.append(slot.room)
+        room_total = getattr(self, 'room_total', None)
+        if room_total is None:
+            room_total = Room.objects.count()
+
+        if len(rooms) == room_total:
             return ''
 
-        return ', '.join([_.name for _ in self.rooms.all()])
+        return ', '.join([_.name for _ in rooms])
 
     def get_slide_url_by_begin_time(self):
-        from datetime import datetime
-
-        if not config.SHOW_SLIDE_DATA:
+        if not self.slide_url or not config.SHOW_SLIDE_DATA:
             return None
 
-        time = self.times.first()
+        slots = self.sorted_slots()
 
-        if not time:
+        if not slots:
             return None
 
-        opendate = datetime(year=time.day.day.year, month=time.day.day.month, day=time.day.day.day, hour=time.begin.hour,
-                            minute=time.begin.minute)
-        if datetime.now() >= opendate:
+        if timezone.now() >= slots[0].begin_datetime:
             return self.slide_url
         else:
             return None
 
     def begin_time(self):
-        return self.times.all()[0].begin.strftime("%H:%M")
+        return timezone.localtime(self.sorted_slots()[0].begin_datetime).strftime("%H:%M")
 
     def get_speakers(self):
         return ', '.join([u'{}({})'.format(_.name, _.email) for _ in self.speakers.all()])
     get_speakers.short_description = u'Speakers'
 
     def get_times(self):
-        times = self.times.all()
+        slots = self.sorted_slots()
 
-        if times:
-            return '%s - %s' % (times[0].begin.strftime("%H:%M"),
-                                times[len(times) - 1].end.strftime("%H:%M"))
+        if slots:
+            end = max(slot.end_datetime for slot in slots)
+            return '%s - %s' % (timezone.localtime(slots[0].begin_datetime).strftime("%H:%M"),
+                                timezone.localtime(end).strftime("%H:%M"))
         else:
             return _("Not arranged yet")
 
@@ -223,6 +248,52 @@ class Program(models.Model):
         return self.name
 
 
+class SlotQuerySet(models.QuerySet):
+    def at(self, moment):
+        return self.filter(begin_datetime__lte=moment, end_datetime__gt=moment)
+
+    def overlapping(self, begin, end):
+        return self.filter(begin_datetime__lt=end, end_datetime__gt=begin)
+
+
+class Slot(models.Model):
+    program = models.ForeignKey(Program, related_name='slots', on_delete=models.CASCADE)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    day = models.ForeignKey(ProgramDate, on_delete=models.CASCADE)
+    begin_datetime = models.DateTimeField()
+    end_datetime = models.DateTimeField()
+
+    objects = SlotQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['begin_datetime', 'room']
+        index_together = [
+            ('room', 'begin_datetime', 'end_datetime'),
+            ('day', 'begin_datetime'),
+            ('program', 'begin_datetime'),
+        ]
+
+    def __str__(self):
+        return '%s / %s / %s' % (self.program, self.room, timezone.localtime(self.begin_datetime))
+
+    def clean(self):
+        if self.begin_datetime is None or self.end_datetime is None:
+            return
+        if self.end_datetime <= self.begin_datetime:
+            raise ValidationError({'end_datetime': _('A slot must end after it begins.')})
+        if self.day_id is not None and self.day.day != timezone.localtime(self.begin_datetime).date():
+            raise ValidationError({'day': _('A slot must begin on its day.')})
+
+
+class ScheduleSnapshot(models.Model):
+    language = models.CharField(max_length=10, unique=True)
+    data = JSONField()
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s / %s' % (self.language, self.modified)
+
+
 class Announcement(models.Model):
     title = models.CharField(max_length=100, db_index=True)
     desc = models.TextField(null=True, blank=True)
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+import bisect
+import heapq
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone, translation
+from sorl.thumbnail import get_thumbnail
+
+from .caches import bump_version, get_version
+from .models import Room, Program, ProgramDate, ProgramTime, ScheduleSnapshot, Slot
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CACHE_TIMEOUT = 60 * 60 * 24
+ICS_CALENDAR_NAME = 'PyCon Korea'
+ICS_UID_DOMAIN = 'pycon.kr'
+
+
+def _speaker_data(speaker):
+    if speaker.image:
+        image = get_thumbnail(speaker.image, '128x128', crop='center').url
+    else:
+        image = static('image/anonymous.png')
+
+    return {
+        'name': speaker.name,
+        'slug': speaker.slug,
+        'url': speaker.get_absolute_url(),
+        'image': image,
+    }
+
+
+def _session_data(program, begin, rowspan, colspan):
+    return {
+        'id': program.id,
+        'name': program.name,
+        'url': program.get_absolute_url(),
+        'room': program.room(),
+        'rowspan': rowspan,
+        'colspan': colspan,
+        'slide_url': program.slide_url,
+        'slide_opens_at': _local(begin).isoformat(timespec='seconds'),
+        'video_url': program.video_url,
+        'pdf_url': program.pdf_url,
+        'difficulty': program.difficulty,
+        'language': program.language,
+        'is_recordable': program.is_recordable,
+        'is_breaktime': program.is_breaktime,
+        'speakers': [_speaker_data(s) for s in program.speakers.all()],
+    }
+
+
+def _local(value):
+    # naive local time; the snapshot is compared against the conference clock
+    return timezone.localtime(value).replace(tzinfo=None)
+
+
+def _parse_local(value):
+    # snapshots written before seconds precision may carry microseconds
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def schedule_cache_key(name, language):
+    return 'schedule:%s:%s:%s' % (name, language, get_version('schedule'))
+
+
+def schedule_sessions(days):
+    """Yield every session of the schedule ``days``."""
+    for day in days:
+        for row in day['rows']:
+            for s in row['sessions'] + [c for c in row['cells'] if c]:
+                yield s
+
+
+def program_session(program):
+    """Slide data of ``program`` in the form ``link_slides`` takes."""
+    slots = program.sorted_slots()
+    return {
+        'slide_url': program.slide_url,
+        'slide_opens_at': _local(slots[0].begin_datetime).isoformat(timespec='seconds') if slots else None,
+    }
+
+
+def link_slides(sessions, show_slide_data, now=None):
+    """Set ``slide_link`` on sessions that have begun.
+
+    Returns the seconds until the next session with slides begins, or
+    ``None`` when nothing will change until the schedule does.
+    """
+    now = now or _local(timezone.now())
+    upcoming = []
+    for s in sessions:
+        if not show_slide_data or not s['slide_url'] or not s['slide_opens_at']:
+            continue
+        opens_at = _parse_local(s['slide_opens_at'])
+        if now >= opens_at:
+            s['slide_link'] = s['slide_url']
+        else:
+            upcoming.append(opens_at)
+
+    if not upcoming:
+        return None
+    return max(int((min(upcoming) - now).total_seconds()), 1)
+
+
+def build_schedule():
+    """Build the per-day, per-time, per-room schedule of the active language.
+
+    Rows are the ProgramTimes of each day. A session starts on the first
+    row its slots cover and spans the rooms sharing the same begin and end.
+    The result only holds plain values so it can be stored as JSON.
+    """
+    dates = list(ProgramDate.objects.all())
+    times = list(ProgramTime.objects.all())
+    rooms = list(Room.objects.all())
+    room_order = {r.id: i for i, r in enumerate(rooms)}
+    programs = Program.objects.order_by('id').with_schedule_relations()
+
+    # day -> [(program, begin, end, rooms)]
+    sessions = {}
+    for program in programs:
+        spans = OrderedDict()
+        for slot in program.sorted_slots():
+            key = (slot.day_id, slot.begin_datetime, slot.end_datetime)
+            spans.setdefault(key, []).append(slot.room_id)
+        for (day_id, begin, end), room_ids in spans.items():
+            sessions.setdefault(day_id, []).append(
+                (program, begin, end, sorted(room_ids, key=room_order.get)))
+
+    schedule = []
+    for d in dates:
+        day_times = [t for t in times if t.day_id == d.id]
+        starts = {}
+        covered = set()
+        for program, begin, end, room_ids in sessions.get(d.id, []):
+            begin_time, end_time = _local(begin).time(), _local(end).time()
+            rows = [i for i, t in enumerate(day_times) if begin_time <= t.begin < end_time]
+            if not rows:
+                logger.warning('%s at %s - %s starts no time row of %s and is left out of the schedule',
+                               program, begin_time, end_time, d)
+                continue
+            if (rows[0], room_ids[0]) in covered:
+                logger.warning('%s at %s - %s overlaps another session on %s and is left out of the schedule',
+                               program, begin_time, end_time, d)
+                continue
+
+            starts[(rows[0], room_ids[0])] = _session_data(program, begin, len(rows), len(room_ids))
+            covered.update((i, r) for i in rows for r in room_ids)
+
+        day_rows = []
+        for i, t in enumerate(day_times):
+            row = {'begin': t.begin.strftime('%H:%M'), 'cells': [], 'sessions': []}
+            for r in rooms:
+                s = starts.get((i, r.id))
+
+                if s:
+                    row['cells'].append(s)
+                    row['sessions'].append(s)
+                elif (i, r.id) not in covered:
+                    row['cells'].append(None)
+            day_rows.append(row)
+        schedule.append({'name': str(d), 'rows': day_rows})
+
+    return {
+        'rooms': [{'id': r.id, 'name': r.name} for r in rooms],
+        'days': schedule,
+    }
+
+
+def build_mobile_schedule():
+    """Build the schedule of the active language for the mobile app.
+
+    Only programs of categories shown in mobile (or without a category)
+    are included, and speakers are limited to those programs.
+    """
+    programs = list(
+        Program.objects.filter(Q(category__isnull=True) | Q(category__show_in_mobile=True))
+        .order_by('id').with_schedule_relations())
+
+    speakers = {}
+    for program in programs:
+        for speaker in program.speakers.all():
+            speakers[speaker.id] = speaker
+
+    return {
+        'dates': [{'id': d.id, 'day': d.day} for d in ProgramDate.objects.all()],
+        'rooms': [{'id': r.id, 'name': r.name, 'location': r.location}
+                  for r in Room.objects.all()],
+        'slots': [{
+            'program': slot.program_id,
+            'room': slot.room_id,
+            'date': slot.day_id,
+            'begin': timezone.localtime(slot.begin_datetime),
+            'end': timezone.localtime(slot.end_datetime),
+        } for program in programs for slot in program.sorted_slots()],
+        'programs': [{
+            'id': p.id,
+            'name': p.name,
+            'brief': p.brief,
+            'category': p.category.slug if p.category else None,
+            'difficulty': p.difficulty,
+            'language': p.language,
+            'slide_url': p.slide_url,
+            'video_url': p.video_url,
+            'pdf_url': p.pdf_url,
+            'is_breaktime': p.is_breaktime,
+            'speakers': [s.id for s in p.speakers.all()],
+        } for p in programs],
+        'speakers': [dict(_speaker_data(s), id=s.id, organization=s.organization)
+                     for s in sorted(speakers.values(), key=lambda s: s.name)],
+    }
+
+
+def get_mobile_schedule_json(language):
+    key = schedule_cache_key('mobile', language)
+    content = cache.get(key)
+    if content is None:
+        with translation.override(language):
+            content = json.dumps(build_mobile_schedule(), cls=DjangoJSONEncoder)
+        cache.set(key, content, SCHEDULE_CACHE_TIMEOUT)
+    return content
+
+
+def mobile_schedule_etag(request, *args, **kwargs):
+    return '%s-%s' % (request.LANGUAGE_CODE, get_version('schedule'))
+
+
+def mobile_schedule_last_modified(request, *args, **kwargs):
+    # the snapshots are rebuilt, and the version bumped, whenever the schedule changes
+    key = schedule_cache_key('modified', request.LANGUAGE_CODE)
+    cached = cache.get(key)
+    if cached is None:
+        cached = (ScheduleSnapshot.objects.filter(language=request.LANGUAGE_CODE)
+                  .values_list('modified', flat=True).first(),)
+        cache.set(key, cached, SCHEDULE_CACHE_TIMEOUT)
+    return cached[0]
+
+
+def _ics_escape(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;') \
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _ics_line(line):
+    # fold at 75 octets without splitting a multi-byte character
+    chunks = []
+    current = ''
+    for char in line:
+        if len((current + char).encode('utf-8')) > (75 if not chunks else 74):
+            chunks.append(current)
+            current = ''
+        current += char
+    chunks.append(current)
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def _ics_time(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def iter_schedule_ics(language, build_absolute_uri, room=None, category=None):
+    """Yield an iCalendar feed of the schedule, one event at a time."""
+    slots = Slot.objects.select_related('program', 'room') \
+        .prefetch_related('program__speakers').order_by('begin_datetime', 'room')
+    if room is not None:
+        slots = slots.filter(room=room)
+    if category is not None:
+        slots = slots.filter(program__category__slug=category)
+
+    with translation.override(language):
+        yield ''.join(_ics_line(line) for line in (
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//PyCon Korea//Schedule//%s' % language.upper(),
+            'CALSCALE:GREGORIAN',
+            'X-WR-CALNAME:%s' % _ics_escape(ICS_CALENDAR_NAME),
+            'X-WR-TIMEZONE:%s' % settings.TIME_ZONE,
+        ))
+
+        stamp = _ics_time(timezone.now())
+        for slot in slots:
+            program = slot.program
+            speakers = ', '.join(s.name for s in program.speakers.all())
+            yield ''.join(_ics_line(line) for line in (
+                'BEGIN:VEVENT',
+                'UID:slot-%d@%s' % (slot.id, ICS_UID_DOMAIN),
+                'DTSTAMP:%s' % stamp,
+                'DTSTART:%s' % _ics_time(slot.begin_datetime),
+                'DTEND:%s' % _ics_time(slot.end_datetime),
+                'SUMMARY:%s' % _ics_escape(program.name),
+                'LOCATION:%s' % _ics_escape(slot.room.name),
+                'DESCRIPTION:%s' % _ics_escape(
+                    '\n\n'.join(v for v in (speakers, program.brief) if v)),
+                'URL:%s' % build_absolute_uri(program.get_absolute_url()),
+                'END:VEVENT',
+            ))
+
+        yield _ics_line('END:VCALENDAR')
+
+
+def cached_chunks(key, chunks):
+    """Pass ``chunks`` through, storing them in the cache once all are sent."""
+    cached = cache.get(key)
+    if cached is not None:
+        yield from cached
+        return
+
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    cache.set(key, sent, SCHEDULE_CACHE_TIMEOUT)
+
+
+def rebuild_schedule_snapshots():
+    for language, _ in settings.LANGUAGES:
+        with translation.override(language):
+            data = build_schedule()
+        ScheduleSnapshot.objects.update_or_create(
+            language=language, defaults={'data': data})
+    bump_version('schedule')
+
+
+def get_schedule_snapshot(language):
+    snapshot = ScheduleSnapshot.objects.filter(language=language).first()
+    if snapshot is not None:
+        return snapshot.data
+
+    with translation.override(language):
+        data = build_schedule()
+    ScheduleSnapshot.objects.update_or_create(
+        language=language, defaults={'data': data})
+    return data
+
+
+def schedule_changed(sender, **kwargs):
+    # Admin saves fire several signals in one transaction; rebuild once after commit
+    if any(func is rebuild_schedule_snapshots for _, func in connection.run_on_commit):
+        return
+    transaction.on_commit(rebuild_schedule_snapshots)
+
+
+def schedule_config_changed(sender, key, old_value, new_value, **kwargs):
+    # constance stores the default on first read, which is not a change
+    if key == 'SHOW_SLIDE_DATA' and old_value is not None and old_value != new_value:
+        bump_version('schedule')
+
+
+class SessionIndex(object):
+    """Sessions of a day per room, with begin/end arrays searched by bisection."""
+
+    def __init__(self, slots):
+        self.rooms = []
+        self._begins = {}
+        self._ends = {}
+        self._sessions = {}
+
+        for slot in sorted(slots, key=lambda s: s.begin_datetime):
+            if slot.room_id not in self._sessions:
+                self.rooms.append({'id': slot.room_id, 'name': slot.room.name})
+                self._begins[slot.room_id] = []
+                self._ends[slot.room_id] = []
+                self._sessions[slot.room_id] = []
+            self._begins[slot.room_id].append(slot.begin_datetime.timestamp())
+            self._ends[slot.room_id].append(slot.end_datetime.timestamp())
+            self._sessions[slot.room_id].append({
+                'id': slot.program_id,
+                'name': slot.program.name,
+                'url': slot.program.get_absolute_url(),
+                'begin': timezone.localtime(slot.begin_datetime).isoformat(),
+                'end': timezone.localtime(slot.end_datetime).isoformat(),
+                'speakers': [s.name for s in slot.program.speakers.all()],
+            })
+
+    def lookup(self, moment):
+        moment = moment.timestamp()
+        result = []
+        for room in self.rooms:
+            begins = self._begins[room['id']]
+            sessions = self._sessions[room['id']]
+            i = bisect.bisect_right(begins, moment)
+            current = None
+            if i > 0 and self._ends[room['id']][i - 1] > moment:
+                current = sessions[i - 1]
+            result.append(dict(room, now=current, next=sessions[i] if i < len(sessions) else None))
+        return result
+
+
+# (language, day) -> SessionIndex, kept per worker process for one schedule version
+_session_indexes = {'version': None, 'indexes': {}}
+
+
+def get_session_index(language, day):
+    version = get_version('schedule')
+    if _session_indexes['version'] != version:
+        _session_indexes['version'] = version
+        _session_indexes['indexes'] = {}
+
+    indexes = _session_indexes['indexes']
+    if (language, day) not in indexes:
+        slots = Slot.objects.filter(day__day=day) \
+            .select_related('room', 'program').prefetch_related('program__speakers')
+        with translation.override(language):
+            indexes[(language, day)] = SessionIndex(list(slots))
+    return indexes[(language, day)]
+
+
+def _overlaps(slots):
+    """Yield overlapping pairs of ``slots`` with a sweep over begin times."""
+    active = []  # heap of (end, index)
+    slots = sorted(slots, key=lambda s: (s.begin_datetime, s.end_datetime))
+    for i, slot in enumerate(slots):
+        while active and active[0][0] <= slot.begin_datetime:
+            heapq.heappop(active)
+        for _, j in active:
+            yield slots[j], slot
+        heapq.heappush(active, (slot.end_datetime, i))
+
+
+def find_schedule_conflicts(program=None):
+    """Return ``(kind, name, slot, other)`` for double-booked rooms and speakers.
+
+    With ``program``, only conflicts involving that program are returned.
+    """
+    slots = Slot.objects.select_related('program', 'room') \
+        .prefetch_related('program__speakers')
+
+    rooms = OrderedDict()
+    speakers = OrderedDict()
+    for slot in slots:
+        rooms.setdefault(slot.room, []).append(slot)
+        for speaker in slot.program.speakers.all():
+            speakers.setdefault(speaker, []).append(slot)
+
+    conflicts = []
+    for kind, groups in (('room', rooms), ('speaker', speakers)):
+        for owner, owned in groups.items():
+            seen = set()
+            for slot, other in _overlaps(owned):
+                # a session held in several rooms shares its speakers
+                pair = (slot.program_id, other.program_id)
+                if pair[0] == pair[1] or pair in seen:
+                    continue
+                if program is not None and program.id not in pair:
+                    continue
+                seen.add(pair)
+                conflicts.append((kind, str(owner), slot, other))
+    return conflicts
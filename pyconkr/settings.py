@@ -67,6 +67,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = [
+    'pyconkr.middleware.ViewMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,13 +77,22 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    'pyconkr.middleware.AnonymousPageCacheMiddleware',
 ]
 
+# view name -> queries allowed per request; None is the default for other views
+VIEW_QUERY_BUDGETS = {
+    None: 50,
+}
+
 ROOT_URLCONF = 'pyconkr.urls'
 
+# With DEBUG off and no explicit 'loaders', Django wraps the loaders in the
+# cached loader; pyconkr.wsgi warms it with every template on startup.
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that times renders for the view metrics
+        'BACKEND': 'pyconkr.template_backends.TimedDjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, "pyconkr/templates"),
         ],
@@ -100,7 +110,7 @@ TEMPLATES = [
                 'pyconkr.context_processors.default',
                 'pyconkr.context_processors.sponsors',
                 'pyconkr.context_processors.profile',
-                'constance.context_processors.config',
+                'pyconkr.context_processors.config',
             ],
         },
     },
@@ -235,6 +245,7 @@ CONSTANCE_CONFIG = {
         'REGISTRATION_CLOSE_TIME': (datetime.time(12,0), 'Registration opening time'),
         'REGISTRATION_CLOSE': (datetime.date(2016,9,1), 'Registration closing date'),
         'TOTAL_TICKET': (1500, 'How many ticket to sold'),
+        'REGISTRATION_ADMISSION_RATE': (20, 'How many buyers to let into payment a second, 0 for no waiting room'),
         'IMP_USER_CODE': ('', 'iamport user code'),
         'IMP_API_KEY': ('', 'iamport api key'),
         'IMP_API_SECRET': ('', 'iamport api secret'),
@@ -0,0 +1,36 @@
+from constance.signals import config_updated
+from django.contrib.flatpages.models import FlatPage
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from .caches import (announcements_changed, banners_changed, flatpage_changed, speakers_changed,
+                     sponsors_changed)
+from .config import config_changed
+from .models import (Announcement, Banner, Room, Program, ProgramCategory, ProgramDate, ProgramTime,
+                     Slot, Speaker, Sponsor, SponsorLevel)
+from .schedule import schedule_changed, schedule_config_changed
+
+
+for model in (Room, Program, ProgramCategory, ProgramDate, ProgramTime, Slot, Speaker):
+    post_save.connect(schedule_changed, sender=model)
+    post_delete.connect(schedule_changed, sender=model)
+
+m2m_changed.connect(schedule_changed, sender=Program.speakers.through)
+
+config_updated.connect(schedule_config_changed)
+config_updated.connect(config_changed)
+
+post_save.connect(flatpage_changed, sender=FlatPage)
+post_delete.connect(flatpage_changed, sender=FlatPage)
+
+for model in (Sponsor, SponsorLevel):
+    post_save.connect(sponsors_changed, sender=model)
+    post_delete.connect(sponsors_changed, sender=model)
+
+post_save.connect(banners_changed, sender=Banner)
+post_delete.connect(banners_changed, sender=Banner)
+
+post_save.connect(speakers_changed, sender=Speaker)
+post_delete.connect(speakers_changed, sender=Speaker)
+
+post_save.connect(announcements_changed, sender=Announcement)
+post_delete.connect(announcements_changed, sender=Announcement)
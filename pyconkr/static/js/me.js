@@ -0,0 +1,44 @@
+// Fills the per-user parts of the page (user menu, messages, CSRF token,
+// edit links)
+// so the rest of the HTML is the same for every visitor.
+$(function() {
+  $.getJSON($('#me-script').data('url'), function(me) {
+    $.ajaxSetup({
+      beforeSend: function(xhr, settings) {
+        if (!csrfSafeMethod(settings.type) && !this.crossDomain) {
+          xhr.setRequestHeader('X-CSRFToken', me.csrf_token);
+        }
+      }
+    });
+
+    if (me.user) {
+      var template = Handlebars.compile($('#user-menu-template').html());
+      $('#user-menu').addClass('dropdown').html(template(me));
+    }
+
+    var editUrls = {};
+    if (me.speaker) {
+      editUrls[me.speaker.url] = me.speaker.edit_url;
+    }
+    $.each(me.programs, function(i, program) {
+      editUrls[program.url] = program.edit_url;
+    });
+    $('.edit-link').each(function() {
+      var link = $(this);
+      if (editUrls[link.data('url')]) {
+        link.append('<hr>').append(
+          $('<a class="btn btn-large btn-primary">')
+            .attr('href', editUrls[link.data('url')])
+            .text(link.data('label')));
+      }
+    });
+
+    var messages = $('#messages');
+    $.each(me.messages, function(i, message) {
+      $('<div class="alert" role="alert">')
+        .addClass(message.tags ? 'alert-' + message.tags : '')
+        .text(message.message)
+        .appendTo(messages);
+    });
+  });
+});
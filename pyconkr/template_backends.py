@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.template.backends.django import DjangoTemplates
+
+from .metrics import render_timer
+
+
+class TimedTemplate(object):
+    """Template of the Django backend that adds its render time to ``render_timer``."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        render_timer.depth += 1
+        started = time.time()
+        try:
+            return self.template.render(context, request)
+        finally:
+            render_timer.depth -= 1
+            # templates rendered while rendering another are already counted
+            if not render_timer.depth:
+                render_timer.seconds += time.time() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` that times every render, ``render()`` and
+    ``TemplateResponse`` alike, for the view metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super(TimedDjangoTemplates, self).from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super(TimedDjangoTemplates, self).get_template(template_name))
@@ -1,14 +1,35 @@
 # -*- coding: utf-8 -*-
+import datetime
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase
 from django.http import HttpResponse
 from django.test import Client
 from django.core.urlresolvers import reverse_lazy, reverse
 from django.contrib.auth import get_user_model
+from django.contrib.flatpages.models import FlatPage
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone, translation
 from django_dynamic_fixture import G
+from constance import config
 
-from pyconkr.models import TutorialCheckin, TutorialProposal
+from pyconkr.models import (Announcement, Banner, TutorialCheckin, TutorialProposal, Room, Program,
+                            ProgramCategory, ProgramDate, ProgramTime, Speaker, ScheduleSnapshot, Slot,
+                            Sponsor, SponsorLevel)
+from pyconkr.caches import (bump_version, check_shared_cache, get_active_banners, get_flatpage_content,
+                            get_sponsor_tree)
+from pyconkr.config import config as cached_config
+from pyconkr.context_processors import profile
 from pyconkr.helper import render_io_error
+from pyconkr.metrics import view_metrics
+from pyconkr.schedule import build_schedule, find_schedule_conflicts, link_slides
 from registration.models import Registration
 
 User = get_user_model()
@@ -86,3 +107,546 @@ class TutorialTest(TestCase):
         # waiting order by pk
         self.assertEqual(attendees[0]['waiting'], False)
         self.assertEqual(attendees[10]['waiting'], True)
+
+
+def make_slot(program, room, time, end_time=None):
+    end_time = end_time or time
+    return Slot.objects.create(
+        program=program, room=room, day=time.day,
+        begin_datetime=timezone.make_aware(datetime.datetime.combine(time.day.day, time.begin)),
+        end_datetime=timezone.make_aware(datetime.datetime.combine(time.day.day, end_time.end)))
+
+
+class ScheduleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_schedule(self, n_days, n_times, n_rooms):
+        rooms = [G(Room) for _ in range(n_rooms)]
+        for d in range(n_days):
+            date = G(ProgramDate, day=datetime.date(2017, 8, 12) + datetime.timedelta(days=d))
+            for t in range(n_times):
+                time = G(ProgramTime, day=date,
+                         begin=datetime.time(9 + t, 0), end=datetime.time(9 + t, 50))
+                for room in rooms:
+                    program = G(Program, date=date)
+                    make_slot(program, room, time)
+                    program.speakers.add(G(Speaker, image=None, info={}))
+        call_command('rebuild_schedule', stdout=StringIO())
+
+    def count_schedule_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('schedule'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_schedule_query_count_does_not_depend_on_grid_size(self):
+        self.make_schedule(1, 1, 1)
+        self.count_schedule_queries()  # constance stores its defaults on first read
+        small = self.count_schedule_queries()
+        self.make_schedule(2, 5, 4)
+        large = self.count_schedule_queries()
+        self.assertEqual(small, large)
+
+    def test_schedule_is_read_from_snapshot(self):
+        self.make_schedule(1, 1, 1)
+        self.assertEqual(ScheduleSnapshot.objects.count(), len(settings.LANGUAGES))
+        program = Program.objects.get()
+        response = self.client.get(reverse('schedule'))
+        self.assertContains(response, program.get_absolute_url())
+
+    def test_schedule_tables_are_cached_until_version_changes(self):
+        self.make_schedule(1, 1, 1)
+        response = self.client.get(reverse('schedule'))
+        self.assertTemplateUsed(response, 'schedule_tables.html')
+        response = self.client.get(reverse('schedule'))
+        self.assertTemplateNotUsed(response, 'schedule_tables.html')
+
+        bump_version('schedule')
+        response = self.client.get(reverse('schedule'))
+        self.assertTemplateUsed(response, 'schedule_tables.html')
+
+    def test_unaligned_slots_are_logged(self):
+        date = G(ProgramDate, day=datetime.date(2017, 8, 12))
+        G(ProgramTime, day=date, begin=datetime.time(10, 0), end=datetime.time(10, 50))
+        program = G(Program, date=date)
+        Slot.objects.create(
+            program=program, room=G(Room), day=date,
+            begin_datetime=timezone.make_aware(datetime.datetime(2017, 8, 12, 14, 0)),
+            end_datetime=timezone.make_aware(datetime.datetime(2017, 8, 12, 14, 50)))
+        with self.assertLogs('pyconkr.schedule', 'WARNING') as logs:
+            build_schedule()
+        self.assertIn('starts no time row', logs.output[0])
+
+    def test_slot_validation(self):
+        date = G(ProgramDate, day=datetime.date(2017, 8, 12))
+        begin = timezone.make_aware(datetime.datetime(2017, 8, 12, 10, 0))
+        slot = Slot(program=G(Program, date=date), room=G(Room), day=date,
+                    begin_datetime=begin, end_datetime=begin)
+        with self.assertRaises(ValidationError):
+            slot.full_clean()
+        slot.end_datetime = begin + datetime.timedelta(minutes=50)
+        slot.full_clean()
+        slot.day = G(ProgramDate, day=datetime.date(2017, 8, 13))
+        with self.assertRaises(ValidationError):
+            slot.full_clean()
+
+    def test_slide_opening_parses_microseconds(self):
+        session = {'slide_url': 'http://slides', 'slide_opens_at': '2017-08-12T10:00:00.500000'}
+        link_slides([session], True, now=datetime.datetime(2017, 8, 12, 11, 0))
+        self.assertEqual(session['slide_link'], 'http://slides')
+
+
+class SlotMigrationTest(TransactionTestCase):
+    before = [('pyconkr', '0021_slot')]
+    after = [('pyconkr', '0022_program_slots')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_times_with_a_gap_become_separate_slots(self):
+        apps = self.migrate(self.before)
+        ProgramDate = apps.get_model('pyconkr', 'ProgramDate')
+        ProgramTime = apps.get_model('pyconkr', 'ProgramTime')
+        date = ProgramDate.objects.create(day=datetime.date(2017, 8, 12))
+        times = [ProgramTime.objects.create(name=str(begin), day=date, begin=begin, end=end) for begin, end in (
+            (datetime.time(10, 0), datetime.time(10, 40)),
+            (datetime.time(10, 40), datetime.time(11, 20)),
+            (datetime.time(14, 0), datetime.time(14, 40)),
+        )]
+        program = apps.get_model('pyconkr', 'Program').objects.create(name='talk', date=date)
+        program.rooms.add(apps.get_model('pyconkr', 'Room').objects.create(name='101'))
+        program.times.add(*times)
+
+        apps = self.migrate(self.after)
+        spans = [(timezone.localtime(s.begin_datetime).time(), timezone.localtime(s.end_datetime).time())
+                 for s in apps.get_model('pyconkr', 'Slot').objects.order_by('begin_datetime')]
+        self.assertEqual(spans, [(datetime.time(10, 0), datetime.time(11, 20)),
+                                 (datetime.time(14, 0), datetime.time(14, 40))])
+
+
+class ProgramTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_schedule_helpers_read_prefetched_relations(self):
+        rooms = [G(Room) for _ in range(3)]
+        date = G(ProgramDate)
+        for i in range(5):
+            program = G(Program, date=date, slide_url=None)
+            time = G(ProgramTime, day=date, begin=datetime.time(10 + i, 0),
+                     end=datetime.time(10 + i, 40))
+            for room in rooms[:2]:
+                make_slot(program, room, time)
+            program.speakers.add(G(Speaker, info={}))
+
+        with self.assertNumQueries(3):
+            programs = list(Program.objects.with_schedule_relations())
+
+        with self.assertNumQueries(0):
+            for program in programs:
+                self.assertNotEqual(program.room(), '')
+                self.assertTrue(program.get_times())
+                self.assertTrue(program.begin_time())
+                self.assertTrue(program.get_speakers())
+                self.assertIsNone(program.get_slide_url_by_begin_time())
+
+    def test_schedule_spans_rooms_and_times_of_a_session(self):
+        rooms = [G(Room) for _ in range(3)]
+        date = G(ProgramDate, day=datetime.date(2017, 8, 13))
+        first = G(ProgramTime, day=date, begin=datetime.time(10, 0), end=datetime.time(10, 40))
+        second = G(ProgramTime, day=date, begin=datetime.time(11, 0), end=datetime.time(11, 40))
+        keynote = G(Program, date=date)
+        for room in rooms[:2]:
+            make_slot(keynote, room, first, second)
+        talk = G(Program, date=date)
+        make_slot(talk, rooms[2], second)
+
+        day = build_schedule()['days'][0]
+        self.assertEqual([len(row['cells']) for row in day['rows']], [2, 1])
+        session = day['rows'][0]['cells'][0]
+        self.assertEqual((session['id'], session['rowspan'], session['colspan']), (keynote.id, 2, 2))
+        self.assertEqual(day['rows'][0]['cells'][1], None)
+        self.assertEqual(day['rows'][1]['sessions'][0]['id'], talk.id)
+
+    def test_now_and_next_sessions_are_served_from_memory(self):
+        room = G(Room)
+        today = timezone.localtime(timezone.now())
+        date = G(ProgramDate, day=today.date())
+        current = G(Program, date=date)
+        upcoming = G(Program, date=date)
+        Slot.objects.create(program=current, room=room, day=date,
+                            begin_datetime=today - datetime.timedelta(minutes=10),
+                            end_datetime=today + datetime.timedelta(minutes=10))
+        Slot.objects.create(program=upcoming, room=room, day=date,
+                            begin_datetime=today + datetime.timedelta(minutes=20),
+                            end_datetime=today + datetime.timedelta(minutes=60))
+
+        response = self.client.get(reverse('schedule_now'))
+        rooms = response.json()['rooms']
+        self.assertEqual(rooms[0]['now']['id'], current.id)
+        self.assertEqual(rooms[0]['next']['id'], upcoming.id)
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('schedule_now'))
+
+    def test_mobile_schedule_is_filtered_and_conditional(self):
+        room = G(Room)
+        time = G(ProgramTime, begin=datetime.time(10), end=datetime.time(11),
+                 day=G(ProgramDate, day=datetime.date(2017, 8, 13)))
+        shown = G(Program, category=G(ProgramCategory, show_in_mobile=True))
+        hidden = G(Program, category=G(ProgramCategory, show_in_mobile=False))
+        make_slot(shown, room, time)
+        make_slot(hidden, room, time)
+
+        response = self.client.get(reverse('schedule_json'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.json()['programs']], [shown.id])
+        self.assertEqual([s['program'] for s in response.json()['slots']], [shown.id])
+
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('schedule_json'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        bump_version('schedule')
+        response = self.client.get(reverse('schedule_json'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_mobile_schedule_answers_if_modified_since(self):
+        call_command('rebuild_schedule', stdout=StringIO())
+        response = self.client.get(reverse('schedule_json'))
+        last_modified = response['Last-Modified']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('schedule_json'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_ics_feed_is_streamed_and_cached(self):
+        rooms = [G(Room), G(Room)]
+        time = G(ProgramTime, begin=datetime.time(10), end=datetime.time(11),
+                 day=G(ProgramDate, day=datetime.date(2017, 8, 13)))
+        programs = [G(Program, name_ko='Session, %d' % i) for i in range(2)]
+        for program, room in zip(programs, rooms):
+            make_slot(program, room, time)
+
+        response = self.client.get(reverse('schedule_ics'))
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.count('BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Session\\, 0\r\n', content)
+        self.assertIn('DTSTART:20170813T010000Z\r\n', content)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('schedule_ics'))
+            self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), content)
+
+        response = self.client.get(reverse('schedule_ics_room', args=[rooms[1].id]))
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.count('BEGIN:VEVENT'), 1)
+        self.assertIn('SUMMARY:Session\\, 1\r\n', content)
+
+    def test_program_list_is_cached_until_schedule_changes(self):
+        room = G(Room)
+        time = G(ProgramTime, begin=datetime.time(10), end=datetime.time(11),
+                 day=G(ProgramDate, day=datetime.date(2017, 8, 13)))
+        categories = [G(ProgramCategory), G(ProgramCategory)]
+        config.SHOW_SLIDE_DATA = True
+
+        def count_queries():
+            for category in categories:
+                make_slot(G(Program, category=category, slide_url='http://slides'), room, time)
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(reverse('programs'))
+            return len(context)
+
+        self.assertEqual(count_queries(), count_queries())
+        response = self.client.get(reverse('programs'))
+        self.assertContains(response, 'http://slides', count=4)
+        self.assertTemplateNotUsed(response, 'pyconkr/program_list_items.html')
+
+        bump_version('schedule')
+        response = self.client.get(reverse('programs'))
+        self.assertTemplateUsed(response, 'pyconkr/program_list_items.html')
+
+    def test_schedule_conflicts(self):
+        rooms = [G(Room), G(Room)]
+        day = G(ProgramDate, day=datetime.date(2017, 8, 13))
+        times = [G(ProgramTime, begin=datetime.time(h), end=datetime.time(h + 1), day=day)
+                 for h in (10, 11)]
+        speaker = G(Speaker)
+        keynote = G(Program)
+        keynote.speakers.add(speaker)
+        make_slot(keynote, rooms[0], times[0], times[1])
+        make_slot(keynote, rooms[1], times[0], times[1])
+        talk = G(Program)
+        talk.speakers.add(speaker)
+        make_slot(talk, rooms[0], times[1])
+        make_slot(G(Program), rooms[1], times[1])
+
+        with self.assertNumQueries(2):
+            conflicts = find_schedule_conflicts()
+        self.assertEqual(sorted((kind, slot.program_id, other.program_id)
+                                for kind, _, slot, other in conflicts),
+                         [('room', keynote.id, talk.id), ('room', keynote.id, talk.id + 1),
+                          ('speaker', keynote.id, talk.id)])
+        self.assertEqual(find_schedule_conflicts(G(Program)), [])
+
+        out = StringIO()
+        call_command('check_schedule_conflicts', stdout=out)
+        self.assertIn('3 conflict(s) found', out.getvalue())
+
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('admin:pyconkr_program_conflicts'))
+        self.assertEqual(len(response.context['conflicts']), 3)
+
+
+class MenuTest(TestCase):
+    def tearDown(self):
+        translation.activate(settings.LANGUAGE_CODE)
+
+    def test_active_menu_is_looked_up_by_path(self):
+        response = self.client.get('/about/sponsor/')
+        self.assertTrue(response.context['menu']['about']['active'])
+        self.assertTrue(response.context['submenu']['sponsor']['active'])
+        self.assertFalse(response.context['submenu']['patron']['active'])
+
+        response = self.client.get('/en/about/sponsor/')
+        self.assertEqual(response.context['title'], 'Sponsors')
+        response = self.client.get('/en/program/%d' % G(Program).id)
+        self.assertEqual(response.context['title'], 'Programs')
+        self.assertEqual(response.context['submenu']['schedule']['path'], '/program/schedule/')
+
+        response = self.client.get(reverse('login'))
+        self.assertIsNone(response.context['submenu'])
+        self.assertFalse(any(v['active'] for v in response.context['menu'].values()))
+        with self.assertRaises(TypeError):
+            response.context['menu']['about']['active'] = True
+
+
+class FlatPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_content_is_cached_until_flatpage_changes(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_flatpage_content('/about/coc/', 'ko'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_flatpage_content('/about/coc/', 'ko'))
+
+        page = FlatPage.objects.create(url='/about/coc/', title='coc', content_ko='행동 강령')
+        self.assertEqual(get_flatpage_content('/about/coc/', 'ko'), '행동 강령')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_flatpage_content('/about/coc/', 'ko'), '행동 강령')
+
+        page.delete()
+        self.assertIsNone(get_flatpage_content('/about/coc/', 'ko'))
+
+
+class SponsorCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sponsor_tree_is_cached_until_sponsors_change(self):
+        gold = G(SponsorLevel, order=1)
+        G(SponsorLevel, order=2)
+        sponsor = G(Sponsor, level=gold, image='sponsor/logo.png')
+
+        tree = get_sponsor_tree('ko')
+        self.assertEqual([level['slug'] for level in tree], [gold.slug])
+        self.assertEqual(tree[0]['sponsors'][0]['image'], '/media/sponsor/logo.png')
+        with self.assertNumQueries(0):
+            get_sponsor_tree('ko')
+
+        sponsor.level = None
+        sponsor.save()
+        self.assertEqual(get_sponsor_tree('ko'), [])
+
+
+class BannerCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_banners_are_cached_until_next_transition(self):
+        now = timezone.now()
+        hour = datetime.timedelta(hours=1)
+        current = G(Banner, begin=now - hour, end=now + hour)
+        upcoming = G(Banner, begin=now + hour / 2, end=now + hour * 2)
+
+        with mock.patch('pyconkr.caches.timezone.now', return_value=now):
+            self.assertEqual(get_active_banners(), [current])
+            with self.assertNumQueries(0):
+                self.assertEqual(get_active_banners(), [current])
+
+        with mock.patch('pyconkr.caches.timezone.now', return_value=now + hour / 2):
+            self.assertEqual(get_active_banners(), [current, upcoming])
+
+        with mock.patch('pyconkr.caches.timezone.now', return_value=now + hour / 2):
+            current.delete()
+            self.assertEqual(get_active_banners(), [upcoming])
+
+
+class ProfileContextTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_speaker_is_looked_up_lazily_and_memoized(self):
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user('speaker', 'speaker@test.com', 'password')
+        with self.assertNumQueries(0):
+            context = profile(request)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(context['my_speaker'])
+        with self.assertNumQueries(0):
+            self.assertFalse(profile(request)['my_speaker'])
+
+        speaker = G(Speaker, email='speaker@test.com')
+        program = G(Program)
+        program.speakers.add(speaker)
+        context = profile(request)
+        self.assertEqual(context['my_speaker'].id, speaker.id)
+        self.assertEqual(list(context['my_programs']), [program])
+
+
+class SharedCacheCheckTest(TestCase):
+    def test_process_local_cache_is_reported(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'}}
+        with self.settings(DEBUG=False, CACHES=locmem):
+            self.assertEqual([e.id for e in check_shared_cache(None)], ['pyconkr.W001'])
+        with self.settings(DEBUG=True, CACHES=locmem):
+            self.assertEqual(check_shared_cache(None), [])
+        with self.settings(DEBUG=False, CACHES=memcached):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class ConfigTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_config_is_loaded_once_until_changed(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(cached_config.SHOW_SLIDE_DATA)
+            self.assertEqual(cached_config.TOTAL_TICKET, settings.CONSTANCE_CONFIG['TOTAL_TICKET'][0])
+        with self.assertNumQueries(0):
+            self.assertFalse(cached_config.SHOW_SLIDE_DATA)
+
+        config.SHOW_SLIDE_DATA = True
+        self.assertTrue(cached_config.SHOW_SLIDE_DATA)
+        with self.assertRaises(AttributeError):
+            cached_config.NOT_A_KEY
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_cached_until_models_change(self):
+        announcement = G(Announcement, title_ko='첫 공지')
+        url = reverse('announcement', args=[announcement.id])
+        self.assertContains(self.client.get(url), '첫 공지')
+
+        response = self.client.get(url)
+        self.assertContains(response, '첫 공지')
+        self.assertTemplateNotUsed(response, 'pyconkr/announcement_detail.html')
+
+        announcement.title_ko = '바뀐 공지'
+        announcement.save()
+        self.assertContains(self.client.get(url), '바뀐 공지')
+
+        User.objects.create_user('test', 'test@test.com', 'password')
+        self.client.login(username='test', password='password')
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'pyconkr/announcement_detail.html')
+
+
+class MeFragmentTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fragment_carries_per_user_state(self):
+        me = self.client.get(reverse('me_fragment')).json()
+        self.assertIsNone(me['user'])
+        self.assertTrue(me['csrf_token'])
+
+        User.objects.create_user('speaker', 'speaker@test.com', 'password')
+        speaker = G(Speaker, email='speaker@test.com')
+        program = G(Program)
+        program.speakers.add(speaker)
+        self.client.login(username='speaker', password='password')
+
+        response = self.client.get(reverse('speakers'))
+        self.assertNotContains(response, 'speaker@test.com')
+        self.assertNotContains(response, reverse('speaker_edit', args=[speaker.slug]))
+
+        me = self.client.get(reverse('me_fragment')).json()
+        self.assertEqual(me['user']['username'], 'speaker')
+        self.assertEqual(me['speaker']['edit_url'], reverse('speaker_edit', args=[speaker.slug]))
+        self.assertEqual(me['programs'], [{'name': program.name, 'url': program.get_absolute_url(),
+                                           'edit_url': reverse('program_edit', args=[program.id])}])
+
+    def test_detail_pages_are_the_same_for_every_visitor(self):
+        User.objects.create_user('speaker', 'speaker@test.com', 'password')
+        speaker = G(Speaker, email='speaker@test.com')
+        program = G(Program)
+        program.speakers.add(speaker)
+        self.client.login(username='speaker', password='password')
+
+        for url, edit_url in ((speaker.get_absolute_url(), reverse('speaker_edit', args=[speaker.slug])),
+                              (program.get_absolute_url(), reverse('program_edit', args=[program.id]))):
+            response = self.client.get(url)
+            self.assertNotContains(response, edit_url)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('Accept-Language', response['Vary'])
+            self.assertIn('Cookie', response['Vary'])
+
+
+class ViewMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        view_metrics.clear()
+
+    def test_metrics_are_recorded_per_view(self):
+        self.client.get(reverse('speakers'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'pyconkr_view_queries_count{view="speakers"} 1')
+        self.assertContains(response, 'pyconkr_view_render_seconds_bucket{view="speakers",le="+Inf"} 1')
+
+    def test_render_time_covers_function_views(self):
+        self.client.get(reverse('schedule'))
+        self.assertGreater(view_metrics._histograms[('pyconkr_view_render_seconds', 'schedule')].sum, 0)
+
+    def test_query_budget_logs_sql(self):
+        with self.settings(VIEW_QUERY_BUDGETS={'speakers': 0}):
+            with self.assertLogs('pyconkr.middleware', 'WARNING') as logs:
+                self.client.get(reverse('speakers'))
+        self.assertIn('speakers ran', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_page_cache_hits_are_labelled_by_view(self):
+        self.client.get(reverse('speakers'))
+        self.client.get(reverse('speakers'))
+        histogram = view_metrics._histograms[('pyconkr_view_duration_seconds', 'speakers')]
+        self.assertEqual(histogram.count, 2)
+        self.assertNotIn(('pyconkr_view_duration_seconds', 'unresolved'), view_metrics._histograms)
+
+
+class TemplateTest(TestCase):
+    def test_every_template_compiles(self):
+        out = StringIO()
+        call_command('precompile_templates', stdout=out, stderr=StringIO())
+        self.assertIn(', 0 failed', out.getvalue())
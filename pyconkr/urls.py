@@ -10,7 +10,7 @@ from pyconkr.views import TutorialProposalCreate, TutorialProposalDetail, \
     TutorialProposalUpdate, TutorialProposalList, tutorial_join,\
     SprintProposalCreate, SprintProposalDetail, sprint_join, SprintProposalUpdate
 
-from .views import index, schedule, robots
+from .views import index, metrics, schedule, schedule_ics, schedule_json, schedule_now, robots
 from .views import RoomDetail
 from .views import AnnouncementList, AnnouncementDetail
 from .views import SpeakerList, SpeakerDetail, SpeakerUpdate
@@ -18,13 +18,14 @@ from .views import SponsorList, SponsorDetail, PatronList
 from .views import ProgramList, ProgramDetail, ProgramUpdate, PreferenceList
 from .views import ProposalCreate, ProposalUpdate, ProposalDetail
 from .views import ProfileDetail, ProfileUpdate
-from .views import login, login_req, login_mailsent, logout
+from .views import login, login_req, login_mailsent, logout, me_fragment
 
 from django.contrib import admin
 admin.autodiscover()
 
 urlpatterns = [
     url(r'^robots.txt$', robots, name='robots'),
+    url(r'^metrics$', metrics, name='metrics'),
     url(r'^summernote/', include('django_summernote.urls')),
     url(r'^admin/', include(admin.site.urls)),
 
@@ -63,6 +64,16 @@ urlpatterns += i18n_patterns(
         SpeakerUpdate.as_view(), name='speaker_edit'),
     url(r'^programs?/schedule/$',
         schedule, name='schedule'),
+    url(r'^programs?/schedule\.json$',
+        schedule_json, name='schedule_json'),
+    url(r'^programs?/schedule\.ics$',
+        schedule_ics, name='schedule_ics'),
+    url(r'^programs?/schedule/room/(?P<room>\d+)\.ics$',
+        schedule_ics, name='schedule_ics_room'),
+    url(r'^programs?/schedule/category/(?P<category>[\w-]+)\.ics$',
+        schedule_ics, name='schedule_ics_category'),
+    url(r'^programs?/now/$',
+        schedule_now, name='schedule_now'),
     url(r'^programs?/tutorials/$',
         TutorialProposalList.as_view(), name='tutorials'),
     url(r'^programs?/tutorial/(?P<pk>\d+)$',
@@ -96,6 +107,7 @@ urlpatterns += i18n_patterns(
     url(r'^login/req/(?P<token>[a-z0-9\-]+)$', login_req, name='login_req'),
     url(r'^login/mailsent/$', login_mailsent, name='login_mailsent'),
     url(r'^logout/$', logout, name='logout'),
+    url(r'^me/fragment$', me_fragment, name='me_fragment'),
 
     url(r'^registration/', include('registration.urls')),
 
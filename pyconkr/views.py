@@ -1,78 +1,101 @@
 # -*- coding: utf-8 -*-
 import logging
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login as user_login, logout as user_logout
 from django.contrib.auth.models import User
-from django.contrib.flatpages.models import FlatPage
 from django.contrib.messages.views import SuccessMessageMixin
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
-from django.db.models import Q
+from django.db.models import Prefetch, Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition
 from django.views.generic import ListView, DetailView, UpdateView, CreateView
 from datetime import datetime, timedelta
 import random
 from .forms import (EmailLoginForm, SpeakerForm, ProgramForm, SprintProposalForm,
                     ProposalForm, ProfileForm, TutorialProposalForm)
+from .caches import get_flatpage_content
+from .context_processors import profile
 from .helper import sendEmailToken
-from .models import (Room, Program, ProgramDate, ProgramTime, ProgramCategory,
+from .metrics import iamport_metrics, view_metrics
+from .schedule import (cached_chunks, get_schedule_snapshot, get_session_index,
+                       get_mobile_schedule_json, iter_schedule_ics, link_slides,
+                       mobile_schedule_etag, mobile_schedule_last_modified,
+                       program_session, schedule_cache_key, schedule_sessions,
+                       SCHEDULE_CACHE_TIMEOUT)
+from .models import (Room, Program, ProgramCategory,
                      Speaker, Sponsor, Announcement, Preference, TutorialProposal,
                      SprintProposal, EmailToken, Profile, Proposal, TutorialCheckin,
                      SprintCheckin)
 from registration.models import Registration, Option
-from constance import config
+from .config import config
 
 logger = logging.getLogger(__name__)
 payment_logger = logging.getLogger('payment')
 
 
 def index(request):
+    base_content = get_flatpage_content('/index/', request.LANGUAGE_CODE)
+    if base_content is None:
+        raise Http404
     return render(request, 'index.html', {
         'index': True,
-        'base_content': FlatPage.objects.get(url='/index/').content,
+        'base_content': base_content,
         'recent_announcements': Announcement.objects.all()[:3],
     })
 
 
 def schedule(request):
-    dates = ProgramDate.objects.all()
-    times = ProgramTime.objects.all().order_by('begin')
-    rooms = Room.objects.all()
-
-    wide = {}
-    narrow = {}
-    processed = set()
-    for d in dates:
-        wide[d] = {}
-        narrow[d] = {}
-        for t in times:
-            if t.day_id != d.id:
-                continue
-            wide[d][t] = {}
-            narrow[d][t] = []
-            for r in rooms:
-                s = Program.objects.filter(date=d, times=t, rooms=r)
-
-                if s:
-                    if s[0].times.all()[0] == t and s[0].id not in processed:
-                        wide[d][t][r] = s[0]
-                        narrow[d][t].append(s[0])
-                        processed.add(s[0].id)
-                else:
-                    wide[d][t][r] = None
-
-            if len(narrow[d][t]) == 0:
-                del(narrow[d][t])
-
-    contexts = {
-        'wide': wide,
-        'narrow': narrow,
-        'rooms': rooms,
-        'width': 100.0 / max(len(rooms), 1),
-    }
-    return render(request, 'schedule.html', contexts)
+    key = schedule_cache_key('tables', request.LANGUAGE_CODE)
+    tables = cache.get(key)
+
+    if tables is None:
+        snapshot = get_schedule_snapshot(request.LANGUAGE_CODE)
+        # re-render when the next session with slides begins
+        timeout = (link_slides(schedule_sessions(snapshot['days']), config.SHOW_SLIDE_DATA)
+                   or SCHEDULE_CACHE_TIMEOUT)
+        tables = render_to_string('schedule_tables.html', {
+            'days': snapshot['days'],
+            'rooms': snapshot['rooms'],
+            'width': 100.0 / max(len(snapshot['rooms']), 1),
+        })
+        cache.set(key, tables, min(timeout, SCHEDULE_CACHE_TIMEOUT))
+
+    return render(request, 'schedule.html', {'tables': tables})
+
+
+def schedule_now(request):
+    now = timezone.now()
+    index = get_session_index(request.LANGUAGE_CODE, timezone.localdate(now))
+    return JsonResponse({
+        'time': timezone.localtime(now).isoformat(),
+        'rooms': index.lookup(now),
+    })
+
+
+@condition(etag_func=mobile_schedule_etag,
+           last_modified_func=mobile_schedule_last_modified)
+def schedule_json(request):
+    return HttpResponse(get_mobile_schedule_json(request.LANGUAGE_CODE),
+                        content_type='application/json')
+
+
+def schedule_ics(request, room=None, category=None):
+    key = schedule_cache_key('ics:%s:%s' % (room, category), request.LANGUAGE_CODE)
+    chunks = iter_schedule_ics(request.LANGUAGE_CODE, request.build_absolute_uri,
+                               room=room, category=category)
+    response = StreamingHttpResponse(cached_chunks(key, chunks),
+                                     content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="schedule.ics"'
+    return response
 
 
 class RoomDetail(DetailView):
@@ -109,15 +132,6 @@ class PatronList(ListView):
 class SpeakerDetail(DetailView):
     model = Speaker
 
-    def get_context_data(self, **kwargs):
-        context = super(SpeakerDetail, self).get_context_data(**kwargs)
-
-        if self.request.user.is_authenticated():
-            if self.request.user.email == self.object.email:
-                context['editable'] = True
-
-        return context
-
 
 class SpeakerUpdate(UpdateView):
     model = Speaker
@@ -132,20 +146,38 @@ class ProgramList(ListView):
     model = ProgramCategory
     template_name = "pyconkr/program_list.html"
 
-
-class ProgramDetail(DetailView):
-    model = Program
+    def get_queryset(self):
+        queryset = super(ProgramList, self).get_queryset()
+        return queryset.prefetch_related(
+            Prefetch('program_set', queryset=Program.objects.with_schedule_relations()))
 
     def get_context_data(self, **kwargs):
-        context = super(ProgramDetail, self).get_context_data(**kwargs)
-        if self.request.user.is_authenticated():
-            for speaker in self.object.speakers.all():
-                if self.request.user.email == speaker.email:
-                    context['editable'] = True
+        context = super(ProgramList, self).get_context_data(**kwargs)
+        key = schedule_cache_key('programs', self.request.LANGUAGE_CODE)
+        programs = cache.get(key)
+
+        if programs is None:
+            categories = list(context['object_list'])
+            sessions = [(program, program_session(program))
+                        for category in categories for program in category.program_set.all()]
+            # re-render when the next program with slides begins
+            timeout = link_slides([s for _, s in sessions], config.SHOW_SLIDE_DATA) or SCHEDULE_CACHE_TIMEOUT
+            for program, session in sessions:
+                program.slide_link = session.get('slide_link')
+
+            programs = render_to_string('pyconkr/program_list_items.html', {
+                'object_list': categories,
+            })
+            cache.set(key, programs, min(timeout, SCHEDULE_CACHE_TIMEOUT))
 
+        context['programs'] = programs
         return context
 
 
+class ProgramDetail(DetailView):
+    model = Program
+
+
 class ProgramUpdate(UpdateView):
     model = Program
     form_class = ProgramForm
@@ -201,6 +233,44 @@ class AnnouncementDetail(DetailView):
     model = Announcement
 
 
+@never_cache
+def me_fragment(request):
+    context = profile(request)
+    speaker = context['my_speaker']
+    data = {
+        'user': None,
+        'speaker': None,
+        'programs': [],
+        'csrf_token': get_token(request),
+        'messages': [{'tags': m.tags, 'message': str(m)} for m in messages.get_messages(request)],
+    }
+
+    if request.user.is_authenticated():
+        image = getattr(getattr(request.user, 'profile', None), 'image', None)
+        data['user'] = {
+            'username': request.user.username,
+            'image': image.url if image else None,
+            'profile_url': reverse('profile'),
+            'logout_url': reverse('logout'),
+        }
+    if speaker:
+        data['speaker'] = {
+            'url': speaker.get_absolute_url(),
+            'edit_url': reverse('speaker_edit', args=[speaker.slug]),
+        }
+        data['programs'] = [{'name': p.name, 'url': p.get_absolute_url(),
+                             'edit_url': reverse('program_edit', args=[p.id])}
+                            for p in context['my_programs']]
+
+    return JsonResponse(data)
+
+
+@staff_member_required
+def metrics(request):
+    return HttpResponse(view_metrics.render() + iamport_metrics.render(),
+                        content_type='text/plain; version=0.0.4')
+
+
 def robots(request):
     return render(request, 'robots.txt', content_type='text/plain')
 
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pyconkr.settings")
 
 application = get_wsgi_application()
+
+# compile templates before the first request instead of while it waits
+from django.conf import settings  # noqa: E402
+
+if not settings.DEBUG:
+    from pyconkr.helper import precompile_templates  # noqa: E402
+    precompile_templates()
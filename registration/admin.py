@@ -2,11 +2,11 @@
 from django.contrib import admin
 from django.core.mail import send_mass_mail
 from django.shortcuts import render
-from constance import config
+from pyconkr.config import config
 from django.utils import timezone
 from .iamporter import get_access_token, Iamporter, IamporterError
 
-from .models import Registration, Option, ManualPayment, IssueTicket
+from .models import Registration, Option, ManualPayment, IssueTicket, SeatReservation, TicketInventory
 
 
 def send_bankpayment_alert_email(modeladmin, request, queryset):
@@ -88,6 +88,7 @@ def cancel_registration(modeladmin, request, queryset):
         obj.canceled = now
         obj.payment_status = 'cancelled'
         obj.save(update_fields=['payment_status', 'canceled'])
+        obj.release_ticket()
 
         obj.cancel_status = 'CANCELLED'
         results.append(obj)
@@ -101,10 +102,23 @@ def cancel_registration(modeladmin, request, queryset):
 cancel_registration.short_description = "Cancel registration"
 
 
+def recount_ticket_inventory(modeladmin, request, queryset):
+    TicketInventory.objects.recount()
+    for option in queryset:
+        TicketInventory.objects.recount(option)
+
+recount_ticket_inventory.short_description = "Recount sold tickets from registrations and held seats"
+
+
 class OptionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'is_active', 'price', 'is_cancelable', 'cancelable_date')
+    list_display = ('name', 'is_active', 'price', 'is_cancelable', 'cancelable_date', 'sold')
     list_editable = ('is_active',)
     ordering = ('id',)
+    list_select_related = ('inventory',)
+    actions = (recount_ticket_inventory,)
+
+    def sold(self, obj):
+        return obj.inventory.sold if hasattr(obj, 'inventory') else None
 admin.site.register(Option, OptionAdmin)
 
 
@@ -121,6 +135,15 @@ class RegistrationAdmin(admin.ModelAdmin):
 admin.site.register(Registration, RegistrationAdmin)
 
 
+class SeatReservationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'option', 'registration', 'status', 'expires_at', 'created')
+    list_filter = ('option', 'status')
+    search_fields = ('user__email', 'registration__merchant_uid', )
+    raw_id_fields = ('user', 'registration', )
+    ordering = ('-created',)
+admin.site.register(SeatReservation, SeatReservationAdmin)
+
+
 class IssueTicketAdmin(admin.ModelAdmin):
     list_display = ('registration', 'issuer', 'issue_date')
     ordering = ('issue_date',)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Waiting room in front of the payment views.
+
+Visitors take a ticket from a counter in the shared cache and are let in
+once the admitted frontier reaches it. The frontier moves forward by
+``REGISTRATION_ADMISSION_RATE`` tickets a second, so the database and the
+PG see at most that many new buyers however many are waiting.
+"""
+import time
+
+from django.core.cache import cache
+
+from pyconkr.caches import get_version
+from pyconkr.config import config
+from .models import SEAT_HOLD_TIMEOUT
+
+QUEUE = 'registration:queue'
+SESSION_TICKET_KEY = 'registration_queue_ticket'
+SESSION_ADMITTED_KEY = 'registration_admitted_until'
+# an admitted visitor has as long as the payment page holds a seat
+ADMISSION_TIMEOUT = SEAT_HOLD_TIMEOUT.total_seconds()
+
+
+def _key(name):
+    # a new queue version starts over if the cache loses the counters
+    return '%s:%s:%s' % (QUEUE, get_version(QUEUE), name)
+
+
+def _counter(name):
+    return cache.get(_key(name)) or 0
+
+
+def _take_ticket():
+    key = _key('tail')
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+def _advance(rate):
+    """Move the admitted frontier by ``rate`` tickets for each second passed.
+
+    One request a second wins the tick and moves it. The frontier runs at
+    most ``rate`` tickets ahead of the queue, so an idle room lets a burst
+    of one second's worth in and no more.
+    """
+    now = int(time.time())
+    if not cache.add(_key('tick:%d' % now), 1, 60):
+        return
+    last = cache.get(_key('ticked')) or now - 1
+    cache.set(_key('ticked'), now, None)
+    head = _counter('head') + rate * max(now - last, 1)
+    cache.set(_key('head'), min(head, _counter('tail') + rate), None)
+
+
+def _ticket(request):
+    ticket = request.session.get(SESSION_TICKET_KEY)
+    if ticket is None or ticket[0] != get_version(QUEUE):
+        ticket = (get_version(QUEUE), _take_ticket())
+        request.session[SESSION_TICKET_KEY] = ticket
+    return ticket[1]
+
+
+def is_admitted(request):
+    rate = config.REGISTRATION_ADMISSION_RATE
+    if rate <= 0 or request.session.get(SESSION_ADMITTED_KEY, 0) > time.time():
+        return True
+    ticket = _ticket(request)
+    _advance(rate)
+    if ticket > _counter('head'):
+        return False
+    request.session[SESSION_ADMITTED_KEY] = time.time() + ADMISSION_TIMEOUT
+    del request.session[SESSION_TICKET_KEY]
+    return True
+
+
+def position(request):
+    """Number of visitors let in before ``request``, 0 once it is admitted."""
+    if is_admitted(request):
+        return 0
+    return request.session[SESSION_TICKET_KEY][1] - _counter('head')
@@ -1 +1 @@
-from .iamporter import Iamporter, IamporterError, get_access_token
+from .iamporter import Iamporter, IamporterError, IamporterTimeout, get_access_token
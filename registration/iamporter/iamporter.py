@@ -1,6 +1,30 @@
 # -*- coding: utf-8 -*-
-import requests
 import datetime
+import hashlib
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from django.core.cache import cache
+
+from pyconkr.metrics import iamport_metrics
+
+API_URL = 'https://api.iamport.kr/'
+# seconds to connect and to wait for a response; a slow PG must not pin a worker
+TIMEOUT = (3.05, 15)
+# connection failures never reached the PG and are retried for any method;
+# failed responses only for GET, as a payment POST must not be sent twice
+RETRY = Retry(total=2, connect=2, read=2, backoff_factor=0.2,
+              method_whitelist=frozenset(['GET']), status_forcelist=(500, 502, 503, 504),
+              raise_on_status=False)
+
+# renew the shared token this many seconds before it expires
+TOKEN_REFRESH_AHEAD = 5 * 60
+# the renewing worker holds the lock for as long as its request may take
+TOKEN_LOCK_TIMEOUT = int(sum(TIMEOUT)) + 1
+# how long others wait for the first token before giving up
+TOKEN_WAIT = TIMEOUT[0]
 
 
 class IamporterError(Exception):
@@ -9,30 +33,104 @@ class IamporterError(Exception):
         self.message = message
         return super(IamporterError, self).__init__('{code}: {message}'.format(code=code, message=message))
 
-def get_access_token(api_key, api_secret):
-    url = 'https://api.iamport.kr/users/getToken'
-    response = requests.post(url, data=dict(
-        imp_key=api_key,
-        imp_secret=api_secret,
-    ))
 
-    if response.status_code != 200:
+class IamporterTimeout(IamporterError):
+    """No response in time; a POST may still have been carried out by the PG."""
+
+
+def build_session():
+    session = requests.Session()
+    session.mount(API_URL, HTTPAdapter(pool_connections=1, pool_maxsize=10, max_retries=RETRY))
+    return session
+
+
+# kept for the life of the process so connections to the PG are reused
+default_session = build_session()
+
+
+def request(session, method, endpoint, path=None, **kwargs):
+    """Call ``endpoint`` of the API and return its ``response`` payload.
+
+    ``endpoint`` is a path template filled from ``path``; it also labels the
+    latency metric, so it must not contain ids itself.
+    """
+    url = API_URL + endpoint.format(**(path or {}))
+    start = time.time()
+    try:
+        response = session.request(method, url, timeout=TIMEOUT, **kwargs)
+    except requests.Timeout as e:
+        raise IamporterTimeout(type(e).__name__, str(e))
+    except requests.RequestException as e:
+        raise IamporterError(type(e).__name__, str(e))
+    finally:
+        iamport_metrics.observe(endpoint, pyconkr_iamport_duration_seconds=time.time() - start)
+
+    if response.status_code != 200 or not response.content:
         raise IamporterError(response.status_code, response.content)
 
-    # TODO : validate expire time
     result = response.json()
 
-    if result['code'] is not 0:
+    if result['code'] != 0:
         raise IamporterError(result['code'], result['message'])
 
-    return result['response']['access_token']
+    return result['response']
+
+
+def request_access_token(api_key, api_secret, session=default_session):
+    """Ask for a new token; returns it with the local time it expires at."""
+    token = request(session, 'POST', 'users/getToken', data=dict(
+        imp_key=api_key,
+        imp_secret=api_secret,
+    ))
+    # expired_at is on the PG's clock, so only trust the lifetime it gives
+    lifetime = token['expired_at'] - token.get('now', time.time())
+    return token['access_token'], time.time() + lifetime
+
+
+def get_access_token(api_key, api_secret):
+    """Return a token shared by all workers through the cache.
+
+    One worker renews it ``TOKEN_REFRESH_AHEAD`` seconds before it expires
+    while the others keep using the current one.
+    """
+    key = 'iamport:token:%s' % hashlib.md5(api_key.encode('utf-8')).hexdigest()
+    lock = key + ':lock'
+    cached = cache.get(key)
+    if cached is not None and cached[1] - time.time() > TOKEN_REFRESH_AHEAD:
+        return cached[0]
+    owns_lock = cache.add(lock, 1, TOKEN_LOCK_TIMEOUT)
+    if not owns_lock:
+        if cached is not None:
+            return cached[0]
+        # another worker is asking for the first token; wait for it a moment
+        deadline = time.time() + TOKEN_WAIT
+        while time.time() < deadline:
+            time.sleep(0.1)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached[0]
+        raise IamporterTimeout(None, 'timed out waiting for the access token')
+    try:
+        token, expires_at = request_access_token(api_key, api_secret)
+    except IamporterError:
+        # keep using the current token if the renewal fails before it expires
+        if cached is None or cached[1] <= time.time():
+            raise
+        return cached[0]
+    else:
+        cache.set(key, (token, expires_at), max(int(expires_at - time.time()), 1))
+        return token
+    finally:
+        if owns_lock:
+            cache.delete(lock)
 
 
 class Iamporter(object):
     TOKEN_HEADER = 'X-ImpTokenHeader'
 
-    def __init__(self, access_token):
+    def __init__(self, access_token, session=default_session):
         self._access_code = access_token
+        self.session = session
 
     def _set_default(self, data, headers):
         if not data:
@@ -44,55 +142,35 @@ class Iamporter(object):
 
         return data, headers
 
-    def _parse_response(self, response):
-        if response.status_code != 200 or not response.content:
-            raise IamporterError(response.status_code, response.content)
-
-        result = response.json()
-
-        if result['code'] is not 0:
-            raise IamporterError(result['code'], result['message'])
-
-        return result['response']
-
-    def _get(self, url, data=None, headers=None):
+    def _get(self, endpoint, data=None, headers=None, **path):
         data, headers = self._set_default(data, headers)
-        response = requests.get(url, headers=headers, params=data)
+        return request(self.session, 'GET', endpoint, path, headers=headers, params=data)
 
-        return self._parse_response(response)
-
-    def _post(self, url, data=None, headers=None):
+    def _post(self, endpoint, data=None, headers=None, **path):
         data, headers = self._set_default(data, headers)
-        response = requests.post(url, headers=headers, data=data)
-
-        return self._parse_response(response)
+        return request(self.session, 'POST', endpoint, path, headers=headers, data=data)
 
     def onetime(self, **params):
-        url = 'https://api.iamport.kr/subscribe/payments/onetime/'
         keys = ['token', 'merchant_uid', 'amount', 'vat', 'card_number', 'expiry', 'birth', 'pwd_2digit',
                 'name', 'remember_me', 'customer_uid', 'buyer_name', 'buyer_email', ]
         data = {k: v for k, v in params.items() if k in keys}
-        return self._post(url, data)
+        return self._post('subscribe/payments/onetime/', data)
 
     def foreign(self, **params):
-        url = 'https://api.iamport.kr/subscribe/payments/foreign/'
         keys = ['token', 'merchant_uid', 'amount', 'vat', 'card_number', 'expiry',
                 'name', 'buyer_name', 'buyer_email', ]
         data = {k: v for k, v in params.items() if k in keys}
-        return self._post(url, data)
+        return self._post('subscribe/payments/foreign/', data)
 
     def cancel(self, **params):
-        url = 'https://api.iamport.kr/payments/cancel/'
         keys = ['merchant_uid', 'reason', ]
         data = {k: v for k, v in params.items() if k in keys}
-        return self._post(url, data)
+        return self._post('payments/cancel/', data)
 
     def find_by_merchant_uid(self, merchant_uid):
-        url = 'https://api.iamport.kr/payments/find/{merchant_uid}'.format(merchant_uid=merchant_uid)
-        return self._get(url)
+        return self._get('payments/find/{merchant_uid}', merchant_uid=merchant_uid)
 
     def get_paid_list(self, since, until=datetime.datetime.now()):
-        url = 'https://api.iamport.kr/payments/status/{payment_status}'.format(payment_status='paid')
         since = int(since.strftime('%s'))
         until = int(until.strftime('%s'))
         data = {
@@ -102,7 +180,7 @@ class Iamporter(object):
                }
         full_list = []
         while True:
-            result = self._get(url, data)
+            result = self._get('payments/status/{payment_status}', data, payment_status='paid')
             full_list.extend(result['list'])
             if result['next'] != 0:
                 data['page'] += 1
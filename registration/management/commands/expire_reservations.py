@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from registration.models import SeatReservation
+
+
+class Command(BaseCommand):
+    help = 'Release seats held past their expiry and drop unpaid registrations'
+
+    def handle(self, *args, **options):
+        released = SeatReservation.objects.sweep()
+        self.stdout.write('released {} seat(s)'.format(released))
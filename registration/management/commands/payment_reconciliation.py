@@ -2,7 +2,7 @@ import datetime
 from django.core.management.base import BaseCommand, CommandError
 from registration.models import Registration, Option
 from registration.iamporter import Iamporter, get_access_token
-from constance import config
+from pyconkr.config import config
 
 class Command(BaseCommand):
     help = 'Cross check paid and registration consistency'
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_sold_tickets(apps, schema_editor):
+    Option = apps.get_model('registration', 'Option')
+    Registration = apps.get_model('registration', 'Registration')
+    TicketInventory = apps.get_model('registration', 'TicketInventory')
+
+    held = Registration.objects.filter(payment_status__in=['paid', 'ready'])
+    TicketInventory.objects.create(option=None, sold=held.count())
+    for option in Option.objects.all():
+        TicketInventory.objects.create(option=option, sold=held.filter(option=option).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0023_issue_manager'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketInventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sold', models.IntegerField(default=0)),
+                ('option', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='registration.Option')),
+            ],
+        ),
+        migrations.RunPython(count_sold_tickets, migrations.RunPython.noop),
+    ]
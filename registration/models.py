@@ -1,10 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
+import datetime
+
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+# payment statuses that hold a ticket
+HELD_STATUSES = ('paid', 'ready')
+
+# how long an opened payment page holds a seat, and how long an unpaid
+# virtual bank transfer may take when the PG gives no due date
+SEAT_HOLD_TIMEOUT = datetime.timedelta(minutes=15)
+VBANK_HOLD_TIMEOUT = datetime.timedelta(days=7)
+
+
 class Option(models.Model):
     name = models.CharField(max_length=50)
     description = models.TextField()
@@ -20,12 +34,74 @@ class Option(models.Model):
 
     @property
     def is_soldout(self):
-        return self.total <= Registration.objects.filter(option=self, payment_status__in=['paid', 'ready']).count()
+        inventory = TicketInventory.objects.filter(option=self).first()
+        if inventory is None:
+            return self.total <= Registration.objects.filter(option=self, payment_status__in=HELD_STATUSES).count()
+        return self.total <= inventory.sold
 
     def __str__(self):
         return self.name
 
 
+class TicketInventoryManager(models.Manager):
+    def _take(self, option, total):
+        updated = self.filter(option=option, sold__lt=total).update(sold=F('sold') + 1)
+        if not updated and not self.filter(option=option).exists():
+            # rows are created with their option; this only covers missing ones
+            self.recount(option)
+            updated = self.filter(option=option, sold__lt=total).update(sold=F('sold') + 1)
+        return bool(updated)
+
+    def reserve(self, option, total):
+        """Take a ticket of ``option`` if it and the ``total`` of all tickets have one left.
+
+        Conditional updates keep concurrent purchases from overselling.
+        """
+        with transaction.atomic():
+            if not self._take(None, total):
+                return False
+            if not self._take(option, option.total):
+                transaction.set_rollback(True)
+                return False
+        return True
+
+    def release(self, option):
+        """Return a ticket of ``option`` taken by a failed or cancelled purchase."""
+        with transaction.atomic():
+            self.filter(option=None, sold__gt=0).update(sold=F('sold') - 1)
+            self.filter(option=option, sold__gt=0).update(sold=F('sold') - 1)
+
+    def recount(self, option=None):
+        """Set the sold count of ``option``, or of all tickets, from the registrations
+        and the seats held by payment pages."""
+        registrations = Registration.objects.filter(payment_status__in=HELD_STATUSES)
+        reservations = SeatReservation.objects.filter(status='held', registration=None)
+        if option is not None:
+            registrations = registrations.filter(option=option)
+            reservations = reservations.filter(option=option)
+        sold = registrations.count() + reservations.count()
+        inventory, created = self.get_or_create(option=option, defaults={'sold': sold})
+        if not created:
+            self.filter(pk=inventory.pk).update(sold=sold)
+
+
+class TicketInventory(models.Model):
+    """Tickets held by paid or ready registrations, per option and in total (no option)."""
+    option = models.OneToOneField(Option, null=True, blank=True, related_name='inventory')
+    sold = models.IntegerField(default=0)
+
+    objects = TicketInventoryManager()
+
+    def __str__(self):
+        return '{} {}'.format(self.option or 'Total', self.sold)
+
+
+@receiver(post_save, sender=Option)
+def create_option_inventory(sender, instance, created, **kwargs):
+    if created:
+        TicketInventory.objects.get_or_create(option=instance)
+
+
 class Registration(models.Model):
     user = models.ForeignKey(User)
     merchant_uid = models.CharField(max_length=32)
@@ -83,6 +159,102 @@ class Registration(models.Model):
     def __str__(self):
         return "{} {} {}".format(self.name, self.email, self.option.name)
 
+    def release_ticket(self):
+        """Return the ticket of a registration that no longer holds one."""
+        reservations = self.seatreservation_set.exclude(status='released')
+        if reservations:
+            for reservation in reservations:
+                reservation.release(['held', 'confirmed'])
+        else:
+            TicketInventory.objects.release(self.option)
+
+
+class SeatReservationManager(models.Manager):
+    def hold(self, user, option, total):
+        """Return the user's live reservation of ``option``, or hold a new seat.
+
+        Returns ``None`` when the option or all tickets are sold out.
+        """
+        now = timezone.now()
+        reservation = self.filter(user=user, option=option, status='held', expires_at__gt=now).first()
+        if reservation is not None:
+            return reservation
+        if not TicketInventory.objects.reserve(option, total):
+            return None
+        return self.create(user=user, option=option, expires_at=now + SEAT_HOLD_TIMEOUT)
+
+    def sweep(self, now=None):
+        """Release expired reservations and drop their unpaid registrations.
+
+        Reservations whose registration was paid meanwhile are confirmed instead.
+        """
+        now = now or timezone.now()
+        released = 0
+        for reservation in self.filter(status='held', expires_at__lte=now):
+            with transaction.atomic():
+                registration = None
+                if reservation.registration_id is not None:
+                    # locked so a payment callback runs wholly before or after this
+                    registration = Registration.objects.select_for_update() \
+                        .filter(pk=reservation.registration_id).first()
+                if registration is not None and registration.payment_status == 'paid':
+                    reservation.confirm(registration)
+                elif reservation.release():
+                    released += 1
+                    if registration is not None and registration.payment_status == 'ready':
+                        registration.payment_status = 'deleted'
+                        registration.save(update_fields=['payment_status'])
+        return released
+
+
+class SeatReservation(models.Model):
+    user = models.ForeignKey(User)
+    option = models.ForeignKey(Option)
+    registration = models.ForeignKey(Registration, null=True, blank=True)
+    status = models.CharField(
+        max_length=10,
+        default='held',
+        choices=(
+            ('held', u'Held'),
+            ('confirmed', u'Confirmed'),
+            ('released', u'Released'),
+        )
+    )
+    expires_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = SeatReservationManager()
+
+    class Meta:
+        index_together = (('status', 'expires_at'),)
+
+    def __str__(self):
+        return "{} {} {}".format(self.user, self.option, self.status)
+
+    def _update(self, statuses, **fields):
+        # conditional on the current status so concurrent calls act once
+        updated = SeatReservation.objects.filter(pk=self.pk, status__in=statuses).update(**fields)
+        if updated:
+            for name, value in fields.items():
+                setattr(self, name, value)
+        return bool(updated)
+
+    def extend(self, registration, expires_at):
+        """Keep holding the seat for an unpaid ``registration`` until ``expires_at``."""
+        return self._update(['held'], registration=registration, expires_at=expires_at)
+
+    def confirm(self, registration):
+        return self._update(['held'], registration=registration, status='confirmed')
+
+    def release(self, statuses=('held',)):
+        """Return the seat; a confirmed one only when ``statuses`` says so."""
+        with transaction.atomic():
+            released = self._update(statuses, status='released')
+            if released:
+                TicketInventory.objects.release(self.option)
+        return released
+
+
 class ManualPayment(models.Model):
     user = models.ForeignKey(User)
     title = models.CharField(max_length=100)
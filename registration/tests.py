@@ -1,15 +1,26 @@
 # -*- coding: utf-8 -*-
 import datetime
+import hashlib
+import threading
+import time
 
+import requests
 from unittest import mock
-from django.test import TestCase
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 from constance.test import override_config
 from django_dynamic_fixture import G
 
-from .models import Option, Registration, IssueTicket
+from pyconkr.metrics import iamport_metrics
+from .iamporter import Iamporter, IamporterError, IamporterTimeout, get_access_token
+from .iamporter.iamporter import RETRY, TIMEOUT
+from .models import Option, Registration, IssueTicket, SeatReservation, TicketInventory
 
 User = get_user_model()
 
@@ -79,3 +90,273 @@ class IssueTicketTest(TestCase):
                                     {'user_id': login_user.id})
         issue_count = IssueTicket.objects.filter(registration__user=login_user).count()
         self.assertEqual(issue_count, 1)
+
+
+class TicketInventoryTest(TestCase):
+    def test_reserve_stops_at_option_and_total_limits(self):
+        option = G(Option, total=2)
+        other = G(Option, total=10)
+        self.assertTrue(TicketInventory.objects.reserve(option, 3))
+        self.assertTrue(TicketInventory.objects.reserve(option, 3))
+        self.assertFalse(TicketInventory.objects.reserve(option, 3))
+        self.assertTrue(option.is_soldout)
+
+        self.assertTrue(TicketInventory.objects.reserve(other, 3))
+        self.assertFalse(TicketInventory.objects.reserve(other, 3))
+        self.assertEqual(TicketInventory.objects.get(option=None).sold, 3)
+        self.assertEqual(TicketInventory.objects.get(option=other).sold, 1)
+
+        TicketInventory.objects.release(option)
+        self.assertFalse(option.is_soldout)
+        self.assertTrue(TicketInventory.objects.reserve(other, 3))
+
+    @override_config(REGISTRATION_OPEN=datetime.date.today()-datetime.timedelta(days=1),
+                     REGISTRATION_CLOSE=datetime.date.today()+datetime.timedelta(days=1))
+    @mock.patch('registration.views.get_access_token')
+    @mock.patch('registration.views.Iamporter')
+    def test_failed_payment_returns_the_ticket(self, Iamporter, get_access_token):
+        Iamporter.return_value.foreign.side_effect = IamporterError(code=-1, message='card declined')
+        option = G(Option, total=1, price=1000, is_active=True)
+        User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.client.login(username='testname', password='testpassword')
+
+        response = self.client.post(reverse('registration_payment'), {
+            'email': 'test@test.com', 'option': option.id, 'base_price': 1000,
+            'additional_price': 0, 'name': 'test', 'top_size': 'small',
+            'phone_number': '010', 'payment_method': 'card', 'merchant_uid': 'uid',
+        })
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(TicketInventory.objects.get(option=option).sold, 0)
+        self.assertEqual(TicketInventory.objects.get(option=None).sold, 0)
+
+
+@override_config(REGISTRATION_OPEN=datetime.date.today()-datetime.timedelta(days=1),
+                 REGISTRATION_CLOSE=datetime.date.today()+datetime.timedelta(days=1))
+class SeatReservationTest(TestCase):
+    def setUp(self):
+        self.option = G(Option, total=1, price=1000, is_active=True)
+        self.user = User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.client.login(username='testname', password='testpassword')
+
+    def post_vbank(self, **data):
+        params = {
+            'email': 'test@test.com', 'option': self.option.id, 'base_price': 1000,
+            'additional_price': 0, 'name': 'test', 'top_size': 'small',
+            'phone_number': '010', 'payment_method': 'vbank', 'merchant_uid': 'uid',
+            'pay_method': 'vbank', 'status': 'ready', 'pg_tid': 'tid',
+        }
+        params.update(data)
+        return self.client.post(reverse('registration_payment'), params)
+
+    def test_payment_page_holds_a_seat_until_it_expires(self):
+        self.client.get(reverse('registration_payment', args=[self.option.id]))
+        self.client.get(reverse('registration_payment', args=[self.option.id]))
+        self.assertEqual(SeatReservation.objects.filter(status='held').count(), 1)
+        self.assertTrue(self.option.is_soldout)
+
+        other = User.objects.create_user('other', 'other@test.com', 'testpassword')
+        self.client.login(username='other', password='testpassword')
+        response = self.client.get(reverse('registration_payment', args=[self.option.id]))
+        self.assertRedirects(response, reverse('registration_index'))
+        self.assertIsNone(SeatReservation.objects.hold(other, self.option, 10))
+
+        self.assertEqual(SeatReservation.objects.sweep(timezone.now() + datetime.timedelta(hours=1)), 1)
+        self.assertFalse(self.option.is_soldout)
+        self.assertIsNotNone(SeatReservation.objects.hold(other, self.option, 10))
+
+    def test_abandoned_vbank_registration_expires(self):
+        due = timezone.now() + datetime.timedelta(days=1)
+        self.client.get(reverse('registration_payment', args=[self.option.id]))
+        response = self.post_vbank(vbank_date=int(due.timestamp()))
+        self.assertTrue(response.json()['success'])
+        reservation = SeatReservation.objects.get()
+        self.assertEqual(reservation.status, 'held')
+        self.assertEqual(int(reservation.expires_at.timestamp()), int(due.timestamp()))
+
+        self.assertEqual(SeatReservation.objects.sweep(), 0)
+        self.assertEqual(SeatReservation.objects.sweep(due + datetime.timedelta(seconds=1)), 1)
+        self.assertEqual(Registration.objects.get().payment_status, 'deleted')
+        self.assertEqual(TicketInventory.objects.get(option=self.option).sold, 0)
+        self.assertEqual(TicketInventory.objects.get(option=None).sold, 0)
+
+    @mock.patch('registration.views.get_access_token')
+    @mock.patch('registration.views.Iamporter')
+    def test_paid_vbank_registration_is_confirmed(self, Iamporter, get_access_token):
+        self.post_vbank(vbank_date='')
+        Iamporter.return_value.find_by_merchant_uid.return_value = dict(merchant_uid='uid', status='paid')
+        self.client.post(reverse('registration_callback'), {'merchant_uid': 'uid'})
+
+        self.assertEqual(SeatReservation.objects.get().status, 'confirmed')
+        call_command('expire_reservations', stdout=mock.Mock())
+        self.assertEqual(Registration.objects.get().payment_status, 'paid')
+        self.assertEqual(TicketInventory.objects.get(option=self.option).sold, 1)
+
+
+    def test_sweep_keeps_paid_registrations_and_confirmed_seats(self):
+        expired = timezone.now() - datetime.timedelta(minutes=1)
+        paid = G(Registration, option=self.option, payment_status='paid')
+        reservation = SeatReservation.objects.create(user=self.user, option=self.option,
+                                                     registration=paid, expires_at=expired)
+        confirmed = SeatReservation.objects.create(user=self.user, option=self.option,
+                                                   status='confirmed', expires_at=expired)
+        sold = TicketInventory.objects.get(option=self.option).sold
+        self.assertEqual(SeatReservation.objects.sweep(), 0)
+        self.assertEqual(Registration.objects.get(pk=paid.pk).payment_status, 'paid')
+        self.assertEqual(SeatReservation.objects.get(pk=reservation.pk).status, 'confirmed')
+        self.assertEqual(TicketInventory.objects.get(option=self.option).sold, sold)
+        self.assertFalse(confirmed.release())
+        self.assertEqual(SeatReservation.objects.get(pk=confirmed.pk).status, 'confirmed')
+
+    @mock.patch('registration.views.get_access_token')
+    @mock.patch('registration.views.Iamporter')
+    def test_late_payment_takes_a_ticket_again(self, Iamporter, get_access_token):
+        registration = G(Registration, option=self.option, payment_status='deleted')
+        Iamporter.return_value.find_by_merchant_uid.return_value = dict(status='paid')
+        self.client.post(reverse('registration_callback'), {'merchant_uid': registration.merchant_uid})
+        self.assertEqual(TicketInventory.objects.get(option=self.option).sold, 1)
+        self.assertEqual(TicketInventory.objects.get(option=None).sold, 1)
+
+
+@override_config(REGISTRATION_OPEN=datetime.date.today()-datetime.timedelta(days=1),
+                 REGISTRATION_CLOSE=datetime.date.today()+datetime.timedelta(days=1),
+                 REGISTRATION_ADMISSION_RATE=2)
+class AdmissionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.option = G(Option, total=10, price=1000, is_active=True)
+
+    def login(self, name):
+        User.objects.create_user(name, '%s@test.com' % name, 'testpassword')
+        self.client.login(username=name, password='testpassword')
+
+    @mock.patch('registration.admission.time')
+    def test_lets_rate_buyers_in_a_second(self, time):
+        time.time.return_value = 1000.0
+        templates = []
+        for name in ('a', 'b', 'c', 'd'):
+            self.login(name)
+            response = self.client.get(reverse('registration_payment', args=[self.option.id]))
+            templates.append(response.templates[0].name)
+        self.assertEqual(templates, ['registration/payment.html'] * 2 + ['registration/waiting.html'] * 2)
+        self.assertEqual(self.client.get(reverse('registration_queue')).json(),
+                         {'admitted': False, 'position': 2})
+
+        time.time.return_value = 1001.0
+        self.assertEqual(self.client.get(reverse('registration_queue')).json(),
+                         {'admitted': True, 'position': 0})
+        response = self.client.get(reverse('registration_payment', args=[self.option.id]))
+        self.assertTemplateUsed(response, 'registration/payment.html')
+
+
+class AccessTokenTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('registration.iamporter.iamporter.request_access_token')
+    def test_token_is_shared_and_renewed_before_it_expires(self, request_access_token):
+        now = time.time()
+        request_access_token.return_value = ('first', now + 30 * 60)
+        self.assertEqual(get_access_token('key', 'secret'), 'first')
+        self.assertEqual(get_access_token('key', 'secret'), 'first')
+        self.assertEqual(request_access_token.call_count, 1)
+
+        request_access_token.return_value = ('second', now + 60 * 60)
+        with mock.patch('registration.iamporter.iamporter.time.time', return_value=now + 28 * 60):
+            self.assertEqual(get_access_token('key', 'secret'), 'second')
+        self.assertEqual(request_access_token.call_count, 2)
+
+    @mock.patch('registration.iamporter.iamporter.request_access_token')
+    def test_failed_renewal_keeps_the_current_token(self, request_access_token):
+        now = time.time()
+        request_access_token.return_value = ('first', now + 60)
+        get_access_token('key', 'secret')
+        request_access_token.side_effect = IamporterError(code=-1, message='down')
+        self.assertEqual(get_access_token('key', 'secret'), 'first')
+
+    @mock.patch('registration.iamporter.iamporter.TOKEN_WAIT', 0.2)
+    @mock.patch('registration.iamporter.iamporter.request_access_token')
+    def test_waiting_for_another_renewal_fails_fast(self, request_access_token):
+        lock = 'iamport:token:%s:lock' % hashlib.md5(b'key').hexdigest()
+        cache.add(lock, 1, 60)
+        with self.assertRaises(IamporterTimeout):
+            get_access_token('key', 'secret')
+        self.assertFalse(request_access_token.called)
+        self.assertIsNotNone(cache.get(lock))
+
+
+class IamporterTest(TestCase):
+    def setUp(self):
+        iamport_metrics.clear()
+        self.session = mock.Mock()
+        self.iamporter = Iamporter('token', session=self.session)
+
+    def test_requests_share_a_session_with_timeouts_and_metrics(self):
+        self.session.request.return_value.status_code = 200
+        self.session.request.return_value.json.return_value = {'code': 0, 'response': {'status': 'paid'}}
+        self.assertEqual(self.iamporter.find_by_merchant_uid('uid'), {'status': 'paid'})
+        self.session.request.assert_called_once_with(
+            'GET', 'https://api.iamport.kr/payments/find/uid', timeout=TIMEOUT,
+            headers={Iamporter.TOKEN_HEADER: 'token'}, params={})
+        self.assertIn('pyconkr_iamport_duration_seconds_count{endpoint="payments/find/{merchant_uid}"} 1',
+                      iamport_metrics.render())
+
+    def test_connection_errors_become_iamporter_errors(self):
+        self.session.request.side_effect = requests.Timeout('read timed out')
+        with self.assertRaises(IamporterError):
+            self.iamporter.cancel(merchant_uid='uid')
+
+    @override_config(REGISTRATION_OPEN=datetime.date.today()-datetime.timedelta(days=1),
+                     REGISTRATION_CLOSE=datetime.date.today()+datetime.timedelta(days=1))
+    @mock.patch('registration.views.get_access_token')
+    @mock.patch('registration.views.Iamporter')
+    def test_timed_out_charge_is_looked_up(self, Iamporter, get_access_token):
+        Iamporter.return_value.foreign.side_effect = IamporterTimeout('ReadTimeout', 'read timed out')
+        Iamporter.return_value.find_by_merchant_uid.return_value = dict(
+            amount=1000, status='paid', pg_tid='tid', pay_method='card')
+        option = G(Option, total=1, price=1000, is_active=True)
+        User.objects.create_user('testname', 'test@test.com', 'testpassword')
+        self.client.login(username='testname', password='testpassword')
+
+        response = self.client.post(reverse('registration_payment'), {
+            'email': 'test@test.com', 'option': option.id, 'base_price': 1000,
+            'additional_price': 0, 'name': 'test', 'top_size': 'small',
+            'phone_number': '010', 'payment_method': 'card', 'merchant_uid': 'uid',
+        })
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(Registration.objects.get(merchant_uid='uid').payment_status, 'paid')
+        self.assertEqual(SeatReservation.objects.get().status, 'confirmed')
+
+    def test_only_idempotent_requests_are_retried_on_errors(self):
+        self.assertTrue(RETRY.is_retry('GET', 503))
+        self.assertFalse(RETRY.is_retry('POST', 503))
+
+
+class TicketInventoryConcurrencyTest(TransactionTestCase):
+    def test_concurrent_purchases_do_not_oversell(self):
+        option = G(Option, total=50)
+        TicketInventory.objects.get_or_create(option=None)
+        results = []
+        barrier = threading.Barrier(200)
+
+        def purchase():
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        results.append(TicketInventory.objects.reserve(option, 40))
+                        return
+                    except OperationalError:
+                        # SQLite locks the table instead of waiting; buy again
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=purchase) for _ in range(200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 40)
+        self.assertEqual(TicketInventory.objects.get(option=None).sold, 40)
+        self.assertEqual(TicketInventory.objects.get(option=option).sold, 40)
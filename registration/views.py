@@ -6,6 +6,8 @@ import json
 import logging
 from uuid import uuid4
 
+from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 from django.utils import timezone
@@ -16,13 +18,15 @@ from django.contrib.auth.models import User
 from django.views.generic import DetailView
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from constance import config
+from pyconkr.config import config
 
 from pyconkr.helper import render_io_error
+from . import admission
 from .forms import (RegistrationForm, RegistrationAdditionalPriceForm,
                     ManualPaymentForm, IssueSubmitForm)
-from .models import Option, Registration, ManualPayment, IssueTicket
-from .iamporter import get_access_token, Iamporter, IamporterError
+from .models import (HELD_STATUSES, VBANK_HOLD_TIMEOUT, Option, Registration, ManualPayment,
+                     IssueTicket, SeatReservation, TicketInventory)
+from .iamporter import get_access_token, Iamporter, IamporterError, IamporterTimeout
 
 logger = logging.getLogger(__name__)
 payment_logger = logging.getLogger('payment')
@@ -34,6 +38,30 @@ def _is_ticket_open():
     return True if open_datetime <= datetime.datetime.now() <= close_datetime else False
 
 
+def _soldout_message(option):
+    if option.is_soldout:
+        return u'{name} 티켓이 매진 되었습니다'.format(name=option.name)
+    return u'티켓이 매진 되었습니다'
+
+
+def _charge(imp_client, charge, imp_params):
+    """Charge the card with ``charge`` and return the payment as the PG recorded it."""
+    try:
+        charge(**imp_params)
+    except IamporterTimeout:
+        # the card may have been charged anyway; the lookup below tells
+        payment_logger.warning('timed out charging %s', imp_params['merchant_uid'])
+    return imp_client.find_by_merchant_uid(imp_params['merchant_uid'])
+
+
+def _vbank_due(vbank_date):
+    """Deadline of a virtual bank transfer; the PG sends it as a unix timestamp."""
+    try:
+        return datetime.datetime.fromtimestamp(int(vbank_date), pytz.utc)
+    except (TypeError, ValueError, OverflowError):
+        return timezone.now() + VBANK_HOLD_TIMEOUT
+
+
 def index(request):
     if request.user.is_authenticated():
         is_registered = Registration.objects.filter(
@@ -96,6 +124,12 @@ def payment(request, option_id):
     if not _is_ticket_open():
         return redirect('registration_index')
 
+    if not admission.is_admitted(request):
+        return render(request, 'registration/waiting.html', {
+            'title': _('Registration'),
+            'position': admission.position(request),
+        })
+
     product = Option.objects.get(id=option_id)
     is_registered = Registration.objects.filter(
         user=request.user,
@@ -105,6 +139,11 @@ def payment(request, option_id):
     if is_registered:
         return redirect('registration_status')
 
+    # hold a seat while the user fills in the payment form
+    if SeatReservation.objects.hold(request.user, product, config.TOTAL_TICKET) is None:
+        messages.error(request, _soldout_message(product))
+        return redirect('registration_index')
+
     uid = str(uuid4()).replace('-', '')
     if product.has_additional_price:
         form = RegistrationAdditionalPriceForm(initial={'email': request.user.email,
@@ -129,6 +168,12 @@ def payment_process(request):
     if request.method == 'GET':
         return redirect('registration_index')
 
+    if not admission.is_admitted(request):
+        return JsonResponse({
+            'success': False,
+            'message': u'결제 대기 시간이 지났습니다. 페이지를 새로고침 해주세요.',
+        })
+
     # alreay registered
     if Registration.objects.filter(user=request.user, payment_status__in=['paid','ready']).exists():
         return redirect('registration_status')
@@ -145,15 +190,6 @@ def payment_process(request):
             'message': form_errors_string,  # TODO : ...
         })
 
-    remain_ticket_count = (config.TOTAL_TICKET - Registration.objects.filter(payment_status__in=['paid', 'ready']).count())
-
-    # sold out
-    if remain_ticket_count <= 0:
-        return JsonResponse({
-            'success': False,
-            'message': u'티켓이 매진 되었습니다',
-        })
-
     if form.cleaned_data.get('additional_price', 0) < 0:
         return JsonResponse({
             'success': False,
@@ -173,11 +209,12 @@ def payment_process(request):
             payment_method = form.cleaned_data.get('payment_method')
         )
 
-    # sold out
-    if registration.option.is_soldout:
+    # use the seat held by the payment page, or hold one if it expired
+    reservation = SeatReservation.objects.hold(request.user, registration.option, config.TOTAL_TICKET)
+    if reservation is None:
         return JsonResponse({
             'success': False,
-            'message': u'{name} 티켓이 매진 되었습니다'.format(name=registration.option.name),
+            'message': _soldout_message(registration.option),
         })
 
     try:
@@ -202,13 +239,8 @@ def payment_process(request):
                 buyer_tel=request.POST.get('phone_number')
 
             )
-            if request.POST.get('birth') == '':
-                # foreign payment
-                imp_client.foreign(**imp_params)
-            else:
-                imp_client.foreign(**imp_params)
-                # imp_client.onetime(**imp_params)
-            confirm = imp_client.find_by_merchant_uid(request.POST.get('merchant_uid'))
+            # domestic cards (with birth) could use imp_client.onetime, but all go through foreign
+            confirm = _charge(imp_client, imp_client.foreign, imp_params)
 
             if confirm['amount'] != product.price + registration.additional_price:
                 # TODO : cancel
@@ -247,6 +279,23 @@ def payment_process(request):
         return JsonResponse({
             'success': True,
         })
+    finally:
+        # keep the seat for a paid registration or until an unpaid transfer is due
+        if registration.pk is not None and registration.payment_status == 'paid':
+            reservation.confirm(registration)
+        elif registration.pk is not None and registration.payment_status == 'ready':
+            reservation.extend(registration, _vbank_due(registration.vbank_date))
+        else:
+            reservation.release()
+
+
+@login_required
+def payment_queue(request):
+    position = admission.position(request)
+    return JsonResponse({
+        'admitted': position == 0,
+        'position': position,
+    })
 
 
 @csrf_exempt
@@ -258,13 +307,27 @@ def payment_callback(request):
     access_token = get_access_token(config.IMP_API_KEY, config.IMP_API_SECRET)
     imp_client = Iamporter(access_token)
     result = imp_client.find_by_merchant_uid(merchant_uid)
-    registration = registration.first()
-    if result['status'] == 'paid':
-        registration.confirmed = datetime.datetime.now()
-    elif result['status'] == 'cancelled':
-        registration.canceled = datetime.datetime.now()
-    registration.payment_status = result['status']
-    registration.save()
+    # locked so an expiring reservation is swept wholly before or after this
+    with transaction.atomic():
+        registration = registration.select_for_update().first()
+        if result['status'] == 'paid':
+            registration.confirmed = datetime.datetime.now()
+        elif result['status'] == 'cancelled':
+            registration.canceled = datetime.datetime.now()
+        was_held = registration.payment_status in HELD_STATUSES
+        registration.payment_status = result['status']
+        registration.save()
+
+        if registration.payment_status == 'paid':
+            for reservation in registration.seatreservation_set.filter(status='held'):
+                reservation.confirm(registration)
+        if was_held and registration.payment_status not in HELD_STATUSES:
+            registration.release_ticket()
+        elif not was_held and registration.payment_status in HELD_STATUSES:
+            # paid after its seat was given up; take a ticket again if one is left
+            if not TicketInventory.objects.reserve(registration.option, config.TOTAL_TICKET):
+                payment_logger.error('oversold: %s paid for %s with no ticket left',
+                                     merchant_uid, registration.option)
     return HttpResponse()
 
 
@@ -340,8 +403,7 @@ def manual_payment_process(request):
             buyer_tel=request.POST.get('phone_number', '')
         )
 
-        imp_client.foreign(**imp_params)
-        confirm = imp_client.find_by_merchant_uid(request.POST.get('merchant_uid'))
+        confirm = _charge(imp_client, imp_client.foreign, imp_params)
 
         if confirm['amount'] != mp.price:
             return render_io_error("amount is not same as product.price. it will be canceled")